@@ -1,26 +1,84 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
+from functools import wraps
+import gzip
 import os
+import time
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, abort, g
+from flask.json.provider import DefaultJSONProvider
+from flask_sqlalchemy import SQLAlchemy
+from markupsafe import Markup
+from sqlalchemy.orm import joinedload, Session
+from library_system.pagination import (keyset_page, sorted_page, encode_cursor, decode_cursor, clamp_limit,
+                                       iter_rows, ndjson_lines, NDJSON_MEDIA_TYPE)
+from library_system.circulation import run_atomically, reserve_copy, release_copy, RecordNotFound
+from library_system import stats
+from library_system.penalties import accrue_overdue, penalty_for
+from library_system.migrations import (migrate, check_query_plans, schema_migrations, hot_queries,
+                                       FLASK_TABLES)
+from library_system.cache import entity_cache, fragment_cache, cached, load_record, invalidate, sync_versions
+from library_system.etags import touch, read_versions, make_etag, etag_matches
+from library_system.pragmas import install_pragmas, check_pragmas, report_pragmas
+from library_system.serializers import book_to_dict, user_to_dict, transaction_to_dict, hold_to_dict, dumps, orjson
+from library_system import holds
+from library_system.archive import archive_returned
+from library_system.isbn import canonical_isbn, canonical_isbns
+from library_system.writer import GroupCommitWriter
+from library_system.autocomplete import PrefixIndex, build as build_autocomplete
+from library_system.config import Config
+from library_system import metrics
+from library_system.profiling import WSGIProfiler
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'sdckl_library_secret_key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///library.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+class LibrarySQLAlchemy(SQLAlchemy):
+    # WAL, busy timeout etc. on every pooled connection (library_system/pragmas.py)
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        install_pragmas(engine)
+        metrics.instrument_engine(engine, 'flask')
+        return engine
+
+db = LibrarySQLAlchemy(app)
+
+if Config.PROFILING:
+    # X-Profile / ?_profile=1 requests (library_system/profiling.py)
+    app.wsgi_app = WSGIProfiler(app.wsgi_app)
+
+class ORJSONProvider(DefaultJSONProvider):
+    # jsonify through orjson (library_system/serializers.py)
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+if Config.ORJSON and orjson is not None:
+    app.json = ORJSONProvider(app)
 
 # Models
 class Book(db.Model):
+    # isbn13 is the canonical form of isbn (library_system/isbn.py); title
+    # and author are the /books page's sort orders
+    __table_args__ = (
+        db.Index('ix_book_isbn13', 'isbn13', unique=True),
+        db.Index('ix_book_title', 'title'),
+        db.Index('ix_book_author', 'author'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     author = db.Column(db.String(255), nullable=False)
     genre = db.Column(db.String(100))
     isbn = db.Column(db.String(20), unique=True, nullable=False)
+    isbn13 = db.Column(db.String(13))
     quantity = db.Column(db.Integer, default=0)
     transactions = db.relationship('Transaction', backref='book', lazy=True)
 
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_name', 'name'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(255), unique=True, nullable=False)
@@ -30,7 +88,19 @@ class User(db.Model):
     books_loaned = db.Column(db.Integer, default=0)
     transactions = db.relationship('Transaction', backref='user', lazy=True)
 
+class Stat(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_transaction_status_due_date', 'status', 'due_date'),
+        db.Index('ix_transaction_user_id_borrow_date', 'user_id', 'borrow_date'),
+        db.Index('ix_transaction_book_id_borrow_date', 'book_id', 'borrow_date'),
+        db.Index('ix_transaction_borrow_date', 'borrow_date'),
+        db.Index('ix_transaction_due_date', 'due_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -43,47 +113,256 @@ class Transaction(db.Model):
     def calculate_penalty(self):
         if self.status == "Returned" or self.status == "Borrowed":
             return 0.00
-        
-        today = datetime.utcnow().date()
-        days_overdue = (today - self.due_date).days
-        if days_overdue <= 0:
-            return 0.00
-            
-        penalty_rate = 5.00  # RM 5.00 per day
-        max_penalty = 50.00  # Maximum RM 50.00
-        penalty = min(days_overdue * penalty_rate, max_penalty)
-        return penalty
+        return penalty_for(self.due_date)
+
+class TransactionArchive(db.Model):
+    # Old returned loans (library_system/archive.py)
+    __table_args__ = (
+        db.Index('ix_transaction_archive_user_id_borrow_date', 'user_id', 'borrow_date'),
+        db.Index('ix_transaction_archive_book_id_borrow_date', 'book_id', 'borrow_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    borrow_date = db.Column(db.Date, nullable=False)
+    due_date = db.Column(db.Date, nullable=False)
+    return_date = db.Column(db.Date)
+    status = db.Column(db.String(50), nullable=False)
+    penalty_fee = db.Column(db.Float, default=0.00)
+    archived_at = db.Column(db.Date, nullable=False)
+
+class Hold(db.Model):
+    # Live holds only (see library_system/holds.py)
+    __table_args__ = (
+        db.Index('ix_hold_book_id_position', 'book_id', 'position'),
+        db.Index('ix_hold_user_id_book_id', 'user_id', 'book_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    placed_at = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.Date)
+
+# Search-box suggestions (library_system/autocomplete.py), built on first use
+# and kept current by the book and user write routes below
+autocomplete_index = PrefixIndex()
+
+# Group commit (library_system/writer.py): with Config.GROUP_COMMIT the write
+# routes queue their work for one writer thread, which commits it in batches
+writer = GroupCommitWriter(lambda: Session(bind=db.engine, expire_on_commit=False),
+                           name='flask') if Config.GROUP_COMMIT else None
+
+def write(work):
+    # Runs work(session) and commits it, on the request's session or in the
+    # writer's next batch
+    if writer is not None:
+        return writer.run(work)
+    return run_atomically(db.session, lambda: work(db.session))
+
+def transactions_with_details():
+    # Load the book and borrower in the same SELECT so listings don't issue
+    # two extra queries per transaction
+    return Transaction.query.options(
+        joinedload(Transaction.book),
+        joinedload(Transaction.user)
+    )
+
+def list_response(query, id_column, serialize):
+    # ?format=ndjson streams every row; otherwise one keyset page is returned
+    # with the cursor to pass as ?after= for the next one
+    if request.args.get('format') == 'ndjson':
+        lines = ndjson_lines(iter_rows(query, id_column), serialize)
+        return Response(stream_with_context(lines), mimetype=NDJSON_MEDIA_TYPE)
+
+    rows, next_cursor = keyset_page(
+        query, id_column,
+        limit=request.args.get('limit', type=int),
+        after=request.args.get('after', type=int)
+    )
+    return jsonify({
+        'items': [serialize(row) for row in rows],
+        'next_cursor': next_cursor
+    })
+
+def conditional(*tables):
+    # ETag from the versions of the tables a GET reads (library_system/etags.py).
+    # The tag is read before the data, and a matching If-None-Match is
+    # answered with a 304 without running the view at all
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            versions = read_versions(db.session, Stat, tables)
+            if versions is None:
+                return view(*args, **kwargs)
+            sync_versions(versions, {'books': Book, 'users': User})
+            # Also keys the listing pages' fragment cache
+            g.versions = versions
+            etag = make_etag(versions)
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                response = Response(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+# Request metrics (library_system/metrics.py)
+@app.before_request
+def start_request_metrics():
+    if Config.METRICS:
+        g.request_metrics = metrics.start_request()
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request_metrics(response):
+    request_metrics = g.pop('request_metrics', None)
+    if request_metrics is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method, started = request.method, g.request_started
+        # Runs once the body has been sent, so streamed exports are timed in full
+        response.call_on_close(lambda: metrics.finish_request(
+            request_metrics, 'flask', method, route, response.status_code, time.perf_counter() - started))
+    return response
+
+@app.after_request
+def compress_response(response):
+    # gzip for HTML pages and JSON bodies. Streamed responses (NDJSON
+    # exports) and small ones go out as they are
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in ('text/html', 'application/json')
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < Config.COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    response.set_data(gzip.compress(data, Config.COMPRESS_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, _ = response.get_etag()
+    if etag:
+        # Not byte-for-byte the uncompressed body any more
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 # Routes
 @app.route('/')
 def index():
-    books_count = Book.query.count()
-    users_count = User.query.count()
-    active_loans = Transaction.query.filter_by(status="Borrowed").count()
-    recent_transactions = Transaction.query.order_by(Transaction.borrow_date.desc()).limit(5).all()
+    counters = stats.read_stats(db.session, Stat, Book, User, Transaction)
+    # Newest first by primary key, which needs no sort over the whole table
+    recent_transactions = transactions_with_details().order_by(Transaction.id.desc()).limit(5).all()
     return render_template('index.html', 
-                         books_count=books_count,
-                         users_count=users_count,
-                         active_loans=active_loans,
+                         books_count=counters['books'],
+                         users_count=counters['users'],
+                         active_loans=counters['active_loans'],
                          recent_transactions=recent_transactions)
 
+# Listing pages. Each shows one keyset page (library_system/pagination.py),
+# sorted on an indexed column and filtered in SQL, so the work per request
+# follows the page size rather than the table size. The rendered table is
+# cached per page and data version, so it is only rebuilt after a write
+BOOK_SORTS = {'title': Book.title, 'author': Book.author, 'id': Book.id}
+USER_SORTS = {'name': User.name, 'id': User.id}
+TRANSACTION_SORTS = {'id': Transaction.id, 'borrow_date': Transaction.borrow_date,
+                     'due_date': Transaction.due_date}
+
+def listing(name, query, sorts, default_sort, id_column, tables, filters):
+    # filters: {param: value} already applied to query; part of the cache key
+    args = request.args
+    sort = args.get('sort') if args.get('sort') in sorts else default_sort[0]
+    order = args.get('order') if args.get('order') in ('asc', 'desc') else default_sort[1]
+    limit = clamp_limit(args.get('limit', type=int) or Config.HTML_PAGE_SIZE)
+    try:
+        after = decode_cursor(args.get('after'), sorts[sort], id_column)
+        before = decode_cursor(args.get('before'), sorts[sort], id_column)
+    except ValueError:
+        after = before = None
+    params = dict({key: value for key, value in filters.items() if value}, sort=sort, order=order)
+    if limit != Config.HTML_PAGE_SIZE:
+        params['limit'] = limit
+
+    def page_url(**changes):
+        return url_for(name, **{key: value for key, value in dict(params, **changes).items() if value is not None})
+
+    def render():
+        rows, next_cursor, prev_cursor = sorted_page(query, sorts[sort], id_column, limit, after, before,
+                                                     descending=order == 'desc')
+        return render_template(f'{name}_table.html', rows=rows, sort=sort, order=order, page_url=page_url,
+                               next_url=page_url(after=encode_cursor(next_cursor)) if next_cursor else None,
+                               prev_url=page_url(before=encode_cursor(prev_cursor)) if prev_cursor else None,
+                               first_url=page_url() if after or before else None)
+
+    versions = g.get('versions') or read_versions(db.session, Stat, tables)
+    if versions is None:
+        table = render()
+    else:
+        key = (name, tuple(sorted(params.items())), args.get('after'), args.get('before'), make_etag(versions))
+        table = cached(fragment_cache, key, render)
+    return render_template(f'{name}.html', table=Markup(table), filters=filters, sort=sort, order=order)
+
 @app.route('/books')
+@conditional('books')
 def books():
-    books = Book.query.all()
-    return render_template('books.html', books=books)
+    q, genre = request.args.get('q', '').strip(), request.args.get('genre', '').strip()
+    query = Book.query
+    if q:
+        try:
+            # An ISBN in any form is one probe of the isbn13 index
+            query = query.filter(Book.isbn13 == canonical_isbn(q))
+        except ValueError:
+            query = query.filter(Book.title.ilike(f'%{q}%') | Book.author.ilike(f'%{q}%')
+                                 | Book.isbn.ilike(f'%{q}%'))
+    if genre:
+        query = query.filter(Book.genre == genre)
+    return listing('books', query, BOOK_SORTS, ('title', 'asc'), Book.id, ('books',),
+                   {'q': q, 'genre': genre})
 
 @app.route('/users')
+@conditional('users')
 def users():
-    users = User.query.all()
-    return render_template('users.html', users=users)
+    q, membership = request.args.get('q', '').strip(), request.args.get('membership', '').strip()
+    query = User.query
+    if q:
+        query = query.filter(User.name.ilike(f'%{q}%') | User.email.ilike(f'%{q}%')
+                             | User.student_id.ilike(f'%{q}%'))
+    if membership:
+        query = query.filter(User.membership_type == membership)
+    return listing('users', query, USER_SORTS, ('name', 'asc'), User.id, ('users',),
+                   {'q': q, 'membership': membership})
 
 @app.route('/transactions')
+@conditional('transactions', 'books', 'users')
 def transactions():
-    transactions = Transaction.query.all()
-    return render_template('transactions.html', transactions=transactions)
+    status = request.args.get('status', '').strip()
+    user_id, book_id = request.args.get('user_id', type=int), request.args.get('book_id', type=int)
+    query = transactions_with_details()
+    if status:
+        query = query.filter(Transaction.status == status)
+    if user_id:
+        query = query.filter(Transaction.user_id == user_id)
+    if book_id:
+        query = query.filter(Transaction.book_id == book_id)
+    return listing('transactions', query, TRANSACTION_SORTS, ('id', 'desc'), Transaction.id,
+                   ('transactions', 'books', 'users'),
+                   {'status': status, 'user_id': user_id, 'book_id': book_id})
 
 # API Routes
 @app.route('/api/books', methods=['GET', 'POST'])
+@conditional('books')
 def api_books():
     if request.method == 'POST':
         data = request.json
@@ -93,75 +372,134 @@ def api_books():
             if field not in data:
                 return jsonify({'error': f'Missing field: {field}'}), 400
         try:
+            isbn13 = canonical_isbn(data['isbn'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        def insert(session):
             new_book = Book(
                 title=data['title'],
                 author=data['author'],
                 genre=data.get('genre', ''),
                 isbn=data['isbn'],
+                isbn13=isbn13,
                 quantity=int(data['quantity'])
             )
-            db.session.add(new_book)
-            db.session.commit()
+            session.add(new_book)
+            stats.bump(session, Stat, books=1, copies=new_book.quantity)
+            touch(session, Stat, 'books')
+            return new_book
+
+        try:
+            new_book = write(insert)
+            autocomplete_index.add_book(new_book.id, new_book.title, new_book.author)
             return jsonify({'message': 'Book added successfully'}), 201
         except Exception as e:
-            db.session.rollback()
             app.logger.error(f"Error adding book: {e}")
             return jsonify({'error': 'Failed to add book'}), 500
     
-    books = Book.query.all()
-    return jsonify([{
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'genre': book.genre,
-        'isbn': book.isbn,
-        'quantity': book.quantity
-    } for book in books])
+    return list_response(Book.query, Book.id, book_to_dict)
 
 @app.route('/api/books/<int:book_id>', methods=['GET', 'PUT', 'DELETE'])
+@conditional('books')
 def api_book_detail(book_id):
-    book = Book.query.get_or_404(book_id)
-
     if request.method == 'GET':
-        return jsonify({
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'genre': book.genre,
-            'isbn': book.isbn,
-            'quantity': book.quantity
-        })
-
-    elif request.method == 'PUT':
+        book = load_record(db.session, Book, book_id)
+        if book is None:
+            abort(404)
+        return jsonify(book_to_dict(book))
+
+    def load(session):
+        book = session.get(Book, book_id)
+        if book is None:
+            raise RecordNotFound("Book not found")
+        return book
+
+    if request.method == 'PUT':
         data = request.json
         required_fields = ['title', 'author', 'isbn', 'quantity']
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'Missing field: {field}'}), 400
         try:
+            isbn13 = canonical_isbn(data['isbn'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        def update(session):
+            book = load(session)
+            previous = (book.title, book.author)
             book.title = data['title']
             book.author = data['author']
             book.genre = data.get('genre', '')
             book.isbn = data['isbn']
+            book.isbn13 = isbn13
+            stats.bump(session, Stat, copies=int(data['quantity']) - book.quantity)
             book.quantity = int(data['quantity'])
-            db.session.commit()
+            touch(session, Stat, 'books')
+            return previous
+
+        try:
+            previous = write(update)
+            invalidate(Book, book_id)
+            autocomplete_index.update_book(book_id, previous, (data['title'], data['author']))
             return jsonify({'message': 'Book updated successfully'})
+        except RecordNotFound:
+            abort(404)
         except Exception as e:
-            db.session.rollback()
             app.logger.error(f"Error updating book: {e}")
             return jsonify({'error': 'Failed to update book'}), 500
 
     elif request.method == 'DELETE':
+        def delete(session):
+            book = load(session)
+            session.delete(book)
+            stats.bump(session, Stat, books=-1, copies=-book.quantity)
+            touch(session, Stat, 'books')
+            return book.title, book.author
+
         try:
-            db.session.delete(book)
-            db.session.commit()
+            previous = write(delete)
+            invalidate(Book, book_id)
+            autocomplete_index.remove_book(book_id, *previous)
             return jsonify({'message': 'Book deleted successfully'})
+        except RecordNotFound:
+            abort(404)
         except Exception as e:
-            db.session.rollback()
             app.logger.error(f"Error deleting book: {e}")
             return jsonify({'error': 'Failed to delete book'}), 500
 
+# Any ISBN-10/13 form, matched on the canonical isbn13 column
+@app.route('/api/books/by-isbn/<isbn>')
+@conditional('books')
+def api_book_by_isbn(isbn):
+    try:
+        isbn13 = canonical_isbn(isbn)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    book = Book.query.filter_by(isbn13=isbn13).first()
+    if book is None:
+        abort(404)
+    return jsonify(book_to_dict(book))
+
+@app.route('/api/books/by-isbn', methods=['POST'])
+def api_books_by_isbn():
+    # {"isbns": [...]}: one IN query, a match per ISBN in request order
+    isbns = (request.json or {}).get('isbns')
+    if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+        return jsonify({'error': 'isbns must be a list of strings'}), 400
+    try:
+        canonical = canonical_isbns(isbns)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    wanted = {isbn13 for isbn13 in canonical.values() if isbn13}
+    found = {book.isbn13: book for book in Book.query.filter(Book.isbn13.in_(wanted))} if wanted else {}
+    return jsonify([{
+        'isbn': isbn,
+        'isbn13': canonical[isbn],
+        'book': book_to_dict(found[canonical[isbn]]) if canonical[isbn] in found else None,
+    } for isbn in isbns])
+
 @app.route('/api/users', methods=['GET', 'POST'])
+@conditional('users')
 def api_users():
     if request.method == 'POST':
         data = request.json
@@ -170,7 +508,7 @@ def api_users():
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'Missing field: {field}'}), 400
-        try:
+        def insert(session):
             new_user = User(
                 name=data['name'],
                 email=data['email'],
@@ -178,69 +516,80 @@ def api_users():
                 membership_type=data['membership_type'],
                 join_date=datetime.utcnow()
             )
-            db.session.add(new_user)
-            db.session.commit()
+            session.add(new_user)
+            stats.bump(session, Stat, users=1)
+            touch(session, Stat, 'users')
+            return new_user
+
+        try:
+            new_user = write(insert)
+            autocomplete_index.add_user(new_user.id, new_user.name)
             return jsonify({'message': 'User added successfully'}), 201
         except Exception as e:
-            db.session.rollback()
             app.logger.error(f"Error adding user: {e}")
             return jsonify({'error': 'Failed to add user'}), 500
     
-    users = User.query.all()
-    return jsonify([{
-        'id': user.id,
-        'name': user.name,
-        'email': user.email,
-        'student_id': user.student_id,
-        'membership_type': user.membership_type,
-        'join_date': user.join_date.strftime('%Y-%m-%d'),
-        'books_loaned': user.books_loaned
-    } for user in users])
+    return list_response(User.query, User.id, user_to_dict)
 
 @app.route('/api/users/<int:user_id>', methods=['GET', 'PUT', 'DELETE'])
+@conditional('users')
 def api_user_detail(user_id):
-    user = User.query.get_or_404(user_id)
-
     if request.method == 'GET':
-        return jsonify({
-            'id': user.id,
-            'name': user.name,
-            'email': user.email,
-            'student_id': user.student_id,
-            'membership_type': user.membership_type,
-            'join_date': user.join_date.strftime('%Y-%m-%d'),
-            'books_loaned': user.books_loaned
-        })
-
-    elif request.method == 'PUT':
+        user = load_record(db.session, User, user_id)
+        if user is None:
+            abort(404)
+        return jsonify(user_to_dict(user))
+
+    def load(session):
+        user = session.get(User, user_id)
+        if user is None:
+            raise RecordNotFound("User not found")
+        return user
+
+    if request.method == 'PUT':
         data = request.json
         required_fields = ['name', 'email', 'membership_type']
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'Missing field: {field}'}), 400
-        try:
+        def update(session):
+            user = load(session)
             user.name = data['name']
             user.email = data['email']
             user.student_id = data.get('student_id')
             user.membership_type = data['membership_type']
-            db.session.commit()
+            touch(session, Stat, 'users')
+
+        try:
+            write(update)
+            invalidate(User, user_id)
+            autocomplete_index.update_user(user_id, data['name'])
             return jsonify({'message': 'User updated successfully'})
+        except RecordNotFound:
+            abort(404)
         except Exception as e:
-            db.session.rollback()
             app.logger.error(f"Error updating user: {e}")
             return jsonify({'error': 'Failed to update user'}), 500
 
     elif request.method == 'DELETE':
+        def delete(session):
+            session.delete(load(session))
+            stats.bump(session, Stat, users=-1)
+            touch(session, Stat, 'users')
+
         try:
-            db.session.delete(user)
-            db.session.commit()
+            write(delete)
+            invalidate(User, user_id)
+            autocomplete_index.remove_user(user_id)
             return jsonify({'message': 'User deleted successfully'})
+        except RecordNotFound:
+            abort(404)
         except Exception as e:
-            db.session.rollback()
             app.logger.error(f"Error deleting user: {e}")
             return jsonify({'error': 'Failed to delete user'}), 500
 
 @app.route('/api/transactions', methods=['GET', 'POST'])
+@conditional('transactions', 'books', 'users')
 def api_transactions():
     if request.method == 'POST':
         data = request.json
@@ -249,79 +598,174 @@ def api_transactions():
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'Missing field: {field}'}), 400
-        try:
-            book = Book.query.get(data['book_id'])
-            user = User.query.get(data['user_id'])
-            if not book or book.quantity <= 0:
-                return jsonify({'error': 'Book not available'}), 400
-            if not user:
-                return jsonify({'error': 'User not found'}), 400
-
-            new_transaction = Transaction(
+        def checkout(session):
+            claimed = holds.claim_hold(session, Hold, User, data['book_id'], data['user_id'],
+                                       Config.MAX_BOOKS_PER_USER)
+            if not claimed:
+                reserve_copy(session, Book, User, data['book_id'], data['user_id'], Config.MAX_BOOKS_PER_USER)
+            session.add(Transaction(
                 book_id=data['book_id'],
                 user_id=data['user_id'],
                 borrow_date=datetime.utcnow(),
                 due_date=datetime.utcnow() + timedelta(days=14),
                 status="Borrowed"
-            )
-            db.session.add(new_transaction)
-
-            # Update book and user records
-            book.quantity -= 1
-            user.books_loaned += 1
+            ))
+            stats.bump(session, Stat, copies=0 if claimed else -1, active_loans=1)
+            touch(session, Stat, 'books', 'users', 'transactions')
 
-            db.session.commit()
+        try:
+            write(checkout)
+            invalidate(Book, data['book_id'])
+            invalidate(User, data['user_id'])
             return jsonify({'message': 'Transaction created successfully'}), 201
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
-            db.session.rollback()
             app.logger.error(f"Error creating transaction: {e}")
             return jsonify({'error': 'Failed to create transaction'}), 500
     
-    transactions = Transaction.query.all()
-    return jsonify([{
-        'id': t.id,
-        'book_title': t.book.title,
-        'user_name': t.user.name,
-        'borrow_date': t.borrow_date.strftime('%Y-%m-%d'),
-        'due_date': t.due_date.strftime('%Y-%m-%d'),
-        'return_date': t.return_date.strftime('%Y-%m-%d') if t.return_date else None,
-        'status': t.status,
-        'penalty_fee': t.calculate_penalty()
-    } for t in transactions])
+    return list_response(transactions_with_details(), Transaction.id, transaction_to_dict)
 
 @app.route('/api/transactions/<int:transaction_id>', methods=['GET'])
+@conditional('transactions', 'books', 'users')
 def api_transaction_detail(transaction_id):
-    transaction = Transaction.query.get_or_404(transaction_id)
-    return jsonify({
-        'id': transaction.id,
-        'book_title': transaction.book.title,
-        'user_name': transaction.user.name,
-        'borrow_date': transaction.borrow_date.strftime('%Y-%m-%d'),
-        'due_date': transaction.due_date.strftime('%Y-%m-%d'),
-        'return_date': transaction.return_date.strftime('%Y-%m-%d') if transaction.return_date else None,
-        'status': transaction.status,
-        'penalty_fee': transaction.calculate_penalty()
-    })
+    transaction = transactions_with_details().get_or_404(transaction_id)
+    return jsonify(transaction_to_dict(transaction))
 
 @app.route('/api/transactions/<int:transaction_id>/return', methods=['POST'])
 def api_return_transaction(transaction_id):
-    transaction = Transaction.query.get_or_404(transaction_id)
-    if transaction.status != 'Borrowed':
-        return jsonify({'error': 'Transaction is not currently borrowed'}), 400
     try:
-        transaction.status = 'Returned'
-        transaction.return_date = datetime.utcnow()
-        # Update book quantity and user loan count
-        transaction.book.quantity += 1
-        transaction.user.books_loaned -= 1
-        db.session.commit()
+        def checkin(session):
+            transaction, previous_status = release_copy(
+                session, Book, User, Transaction, transaction_id, datetime.utcnow()
+            )
+            transaction.penalty_fee = penalty_for(transaction.due_date, transaction.return_date)
+            stats.loan_closed(session, Stat, previous_status)
+            holds.assign_copy(session, Hold, Book, Stat, transaction.book_id)
+            touch(session, Stat, 'books', 'users', 'transactions')
+            return transaction
+
+        transaction = write(checkin)
+        invalidate(Book, transaction.book_id)
+        invalidate(User, transaction.user_id)
         return jsonify({'message': 'Book returned successfully'})
+    except RecordNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        db.session.rollback()
         app.logger.error(f"Error returning book: {e}")
         return jsonify({'error': 'Failed to return book'}), 500
 
+def hold_response(hold):
+    return dict(hold_to_dict(hold), ahead=holds.queue_ahead(db.session, Hold, hold))
+
+@app.route('/api/holds', methods=['POST'])
+def api_holds():
+    data = request.json
+    for field in ['book_id', 'user_id']:
+        if field not in data:
+            return jsonify({'error': f'Missing field: {field}'}), 400
+    try:
+        hold = write(lambda session: holds.place_hold(
+            session, Hold, Book, User, data['book_id'], data['user_id']))
+        return jsonify(hold_response(hold)), 201
+    except RecordNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error placing hold: {e}")
+        return jsonify({'error': 'Failed to place hold'}), 500
+
+@app.route('/api/holds/<int:hold_id>', methods=['GET', 'DELETE'])
+def api_hold_detail(hold_id):
+    if request.method == 'DELETE':
+        def cancel(session):
+            book_id = holds.cancel_hold(session, Hold, Book, Stat, hold_id)
+            touch(session, Stat, 'books')
+            return book_id
+
+        try:
+            invalidate(Book, write(cancel))
+            return jsonify({'message': 'Hold cancelled'})
+        except RecordNotFound as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error cancelling hold: {e}")
+            return jsonify({'error': 'Failed to cancel hold'}), 500
+
+    return jsonify(hold_response(Hold.query.get_or_404(hold_id)))
+
+@app.route('/api/autocomplete')
+def api_autocomplete():
+    # Rebuilt in-line once it is older than the rebuild interval, picking up
+    # other workers' writes
+    if autocomplete_index.needs_build(Config.AUTOCOMPLETE_REBUILD_INTERVAL):
+        build_autocomplete(autocomplete_index, db.session, Book, User)
+    kinds = request.args.get('type')
+    return jsonify(autocomplete_index.suggest(request.args.get('q', ''), request.args.get('limit', type=int),
+                                              kinds.split(',') if kinds else None))
+
+@app.route('/api/autocomplete/stats')
+def api_autocomplete_stats():
+    return jsonify(autocomplete_index.memory_usage())
+
+@app.route('/api/cache/stats')
+def api_cache_stats():
+    return jsonify(dict(entity_cache.stats(), fragments=fragment_cache.stats()))
+
+@app.route('/api/writer/stats')
+def api_writer_stats():
+    return jsonify(writer.stats() if writer else {'group_commit': False})
+
+# Schema changes for existing databases; see library_system/migrations.py
+MIGRATIONS = schema_migrations(FLASK_TABLES, listing_indexes=True)
+HOT_QUERIES = hot_queries(FLASK_TABLES)
+
+@app.cli.command('migrate')
+def migrate_command():
+    db.create_all()
+    ran = migrate(db.engine, MIGRATIONS)
+    print(f"Applied: {', '.join(ran)}" if ran else "Schema is up to date")
+    for name, (uses_index, plan) in check_query_plans(db.engine, HOT_QUERIES, FLASK_TABLES['transaction']).items():
+        print(f"{'ok  ' if uses_index else 'FAIL'} {name}: {'; '.join(plan)}")
+    for name, (configured, effective, ok) in check_pragmas(db.engine).items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name} = {effective} (configured {configured})")
+
+@app.cli.command('accrue-penalties')
+def accrue_penalties_command():
+    # Nightly job: flask --app app accrue-penalties
+    newly_overdue = run_atomically(db.session, lambda: accrue_overdue(db.session, Transaction, Stat))
+    print(f"{newly_overdue} loans became overdue")
+
+@app.cli.command('expire-holds')
+def expire_holds_command():
+    # Hourly job: flask --app app expire-holds
+    def sweep():
+        changed = holds.expire_holds(db.session, Hold, Book, Stat)
+        if changed:
+            touch(db.session, Stat, 'books')
+        return changed
+
+    changed = run_atomically(db.session, sweep)
+    for book_id in changed:
+        invalidate(Book, book_id)
+    print(f"{len(changed)} books had held copies passed on")
+
+@app.cli.command('archive-loans')
+def archive_loans_command():
+    # Nightly job: flask --app app archive-loans
+    moved = archive_returned(db.session, Transaction, TransactionArchive, Stat)
+    print(f"{moved} loans archived")
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        migrate(db.engine, MIGRATIONS)
+        report_pragmas(db.engine)
     app.run(debug=True, port=5000)
@@ -1,6 +1,9 @@
+import argparse
+import time
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from models import Base, Book, User, Transaction
+from library_system.datagen import add_arguments, generate_from_args
 from datetime import datetime, timedelta
 
 # Create database engine (using SQLite for simplicity)
@@ -111,5 +114,27 @@ def init_database():
     finally:
         session.close()
 
+def generate_database(args):
+    # Synthetic dataset at any scale, e.g.
+    #   python init_db.py --generate --books 1000000 --users 200000 --loans 5000000 --seed 7
+    try:
+        started = time.perf_counter()
+        summary = generate_from_args(engine, Book, User, Transaction, args,
+                                     progress=lambda message: print(message, flush=True))
+        print(", ".join(f"{key}={value}" for key, value in summary.items()),
+              f"generated in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"Error generating database: {e}")
+    finally:
+        session.close()
+
 if __name__ == "__main__":
-    init_database()
+    parser = argparse.ArgumentParser(description="Initialize the library database")
+    parser.add_argument('--generate', action='store_true',
+                        help="Fill the empty database with a synthetic dataset instead of the sample rows")
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.generate:
+        generate_database(args)
+    else:
+        init_database()
@@ -1,17 +1,19 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, joinedload
 from models import Book, User, Transaction
+from library_system.search import install_fts, search_fts
+from library_system.circulation import run_atomically, reserve_copy, release_copy
+from library_system.penalties import accrue_overdue, penalty_for
+from library_system.cache import load_record, invalidate
+from library_system.pragmas import install_pragmas
 from datetime import datetime, timedelta
-from decimal import Decimal
 
 # Database configuration
 DATABASE_URL = "sqlite:///library.db"
 engine = create_engine(DATABASE_URL)
+install_pragmas(engine)
 Session = sessionmaker(bind=engine)
-
-# Penalty fee configuration
-PENALTY_RATE_PER_DAY = Decimal('5.00')  # RM 5.00 per day
-MAX_PENALTY_FEE = Decimal('50.00')      # Maximum RM 50.00
+FULL_TEXT_SEARCH = install_fts(engine)
 
 class LibraryOperations:
     def __init__(self):
@@ -38,9 +40,12 @@ class LibraryOperations:
             raise e
 
     def get_book(self, book_id):
-        return self.session.query(Book).get(book_id)
+        # Cached read-only snapshot
+        return load_record(self.session, Book, book_id)
 
     def search_books(self, query):
+        if FULL_TEXT_SEARCH:
+            return search_fts(self.session, Book, 'books_fts', query)
         return self.session.query(Book).filter(
             (Book.title.ilike(f"%{query}%")) |
             (Book.author.ilike(f"%{query}%")) |
@@ -48,10 +53,11 @@ class LibraryOperations:
         ).all()
 
     def update_book_quantity(self, book_id, new_quantity):
-        book = self.get_book(book_id)
+        book = self.session.get(Book, book_id)
         if book:
             book.quantity = new_quantity
             self.session.commit()
+            invalidate(Book, book_id)
             return True
         return False
 
@@ -74,9 +80,11 @@ class LibraryOperations:
             raise e
 
     def get_user(self, user_id):
-        return self.session.query(User).get(user_id)
+        return load_record(self.session, User, user_id)
 
     def search_users(self, query):
+        if FULL_TEXT_SEARCH:
+            return search_fts(self.session, User, 'users_fts', query)
         return self.session.query(User).filter(
             (User.name.ilike(f"%{query}%")) |
             (User.email.ilike(f"%{query}%")) |
@@ -85,16 +93,8 @@ class LibraryOperations:
 
     # Transaction Operations
     def borrow_book(self, book_id, user_id, due_date):
-        try:
-            book = self.get_book(book_id)
-            user = self.get_user(user_id)
-            
-            if not book or not user:
-                raise ValueError("Book or user not found")
-            
-            if book.quantity <= 0:
-                raise ValueError("Book not available")
-            
+        def checkout():
+            reserve_copy(self.session, Book, User, book_id, user_id)
             transaction = Transaction(
                 book_id=book_id,
                 user_id=user_id,
@@ -103,69 +103,48 @@ class LibraryOperations:
                 status="Borrowed",
                 penalty_fee=0.00
             )
-            
-            book.quantity -= 1
-            user.books_loaned += 1
-            
             self.session.add(transaction)
-            self.session.commit()
             return transaction
-        except Exception as e:
-            self.session.rollback()
-            raise e
+
+        transaction = run_atomically(self.session, checkout)
+        invalidate(Book, book_id)
+        invalidate(User, user_id)
+        return transaction
 
     def return_book(self, transaction_id):
-        try:
-            transaction = self.session.query(Transaction).get(transaction_id)
-            if not transaction:
-                raise ValueError("Transaction not found")
-            
-            if transaction.status == "Returned":
-                raise ValueError("Book already returned")
-            
-            # Calculate penalty if overdue
+        def checkin():
             today = datetime.now().date()
-            if today > transaction.due_date:
-                days_overdue = (today - transaction.due_date).days
-                penalty = Decimal(str(days_overdue)) * PENALTY_RATE_PER_DAY
-                transaction.penalty_fee = min(penalty, MAX_PENALTY_FEE)
-            
-            transaction.return_date = today
-            transaction.status = "Returned"
-            
-            # Update book quantity and user's borrowed books count
-            book = self.get_book(transaction.book_id)
-            user = self.get_user(transaction.user_id)
-            book.quantity += 1
-            user.books_loaned -= 1
-            
-            self.session.commit()
+            transaction, _ = release_copy(self.session, Book, User, Transaction, transaction_id, today)
+            transaction.penalty_fee = penalty_for(transaction.due_date, today)
             return transaction
-        except Exception as e:
-            self.session.rollback()
-            raise e
+
+        transaction = run_atomically(self.session, checkin)
+        invalidate(Book, transaction.book_id)
+        invalidate(User, transaction.user_id)
+        return transaction
 
     def get_overdue_transactions(self):
         today = datetime.now().date()
-        return self.session.query(Transaction).filter(
+        return self.session.query(Transaction).options(
+            joinedload(Transaction.book),
+            joinedload(Transaction.user)
+        ).filter(
             Transaction.due_date < today,
             Transaction.status != "Returned"
         ).all()
 
+    def accrue_penalties(self):
+        return run_atomically(self.session, lambda: accrue_overdue(self.session, Transaction))
+
     def calculate_penalty(self, transaction_id):
-        transaction = self.session.query(Transaction).get(transaction_id)
-        if not transaction:
+        # The stored fee: final once returned, and kept current for open loans
+        # by accrue_penalties
+        row = self.session.query(Transaction.penalty_fee).filter(
+            Transaction.id == transaction_id
+        ).one_or_none()
+        if row is None:
             raise ValueError("Transaction not found")
-        
-        if transaction.status == "Returned":
-            return transaction.penalty_fee
-        
-        today = datetime.now().date()
-        if today > transaction.due_date:
-            days_overdue = (today - transaction.due_date).days
-            penalty = Decimal(str(days_overdue)) * PENALTY_RATE_PER_DAY
-            return min(penalty, MAX_PENALTY_FEE)
-        return Decimal('0.00')
+        return row.penalty_fee
 
 # Example usage:
 if __name__ == "__main__":
@@ -176,11 +155,11 @@ if __name__ == "__main__":
         for book in books:
             print(f"Found book: {book.title} by {book.author}")
         
-        # Check overdue books
+        # Bring fines up to date in bulk, then read them straight off the rows
+        lib.accrue_penalties()
         overdue = lib.get_overdue_transactions()
         for transaction in overdue:
-            penalty = lib.calculate_penalty(transaction.id)
-            print(f"Overdue book: {transaction.book.title}, Penalty: RM {penalty:.2f}")
+            print(f"Overdue book: {transaction.book.title}, Penalty: RM {transaction.penalty_fee:.2f}")
             
     finally:
         lib.close()
@@ -35,6 +35,11 @@ CREATE TABLE transactions (
   FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
+-- Indexes for the overdue and loan history lookups
+CREATE INDEX ix_transactions_status_due_date ON transactions (status, due_date);
+CREATE INDEX ix_transactions_user_id_borrow_date ON transactions (user_id, borrow_date);
+CREATE INDEX ix_transactions_book_id_borrow_date ON transactions (book_id, borrow_date);
+
 -- Sample data for Books
 INSERT INTO books (title, author, genre, isbn, quantity) VALUES
 ('The Great Gatsby', 'F. Scott Fitzgerald', 'Classic Fiction', '978-0743273565', 3),
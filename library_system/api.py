@@ -1,17 +1,36 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional, List
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Request, Response
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import AliasPath, BaseModel, ConfigDict, Field
+from datetime import date, datetime
+import asyncio
+import logging
+import tempfile
+from typing import Optional, List, Union
 from .operations import LibrarySystem
+from .serializers import book_to_dict, user_to_dict, dumps, orjson
+from .pagination import ndjson_lines, NDJSON_MEDIA_TYPE
+from .sessions import get_library, open_library, dispose_engines, get_writer
+from .models import get_engine, startup_schema_check
+from .pragmas import report_pragmas
+from .importer import IMPORTERS, FORMATS
+from .cache import entity_cache
+from .etags import etag_matches
+from .circulation import RecordNotFound
+from .events import broker
+from . import autocomplete
+from . import metrics
+from .profiling import ASGIProfiler
 from .config import Config
 
-app = FastAPI(
-    title=Config.LIBRARY_NAME,
-    description="Library Management System API",
-    version=Config.VERSION
-)
+logger = logging.getLogger(__name__)
 
-library = LibrarySystem()
+class ORJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content).encode()
+
+router = APIRouter()
 
 # Pydantic models for request/response
 class BookCreate(BaseModel):
@@ -31,16 +50,130 @@ class TransactionCreate(BaseModel):
     book_id: int
     user_id: int
 
+class HoldCreate(BaseModel):
+    book_id: int
+    user_id: int
+
+class IsbnLookup(BaseModel):
+    isbns: List[str]
+
+# Response models, read straight off ORM rows or cache snapshots. Same shape
+# as library_system/serializers.py, which the Flask app uses
+class BookOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str
+    author: str
+    genre: Optional[str] = None
+    isbn: str
+    quantity: Optional[int] = None
+
+class UserOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    email: str
+    student_id: Optional[str] = None
+    membership_type: str
+    join_date: date
+    books_loaned: Optional[int] = None
+
+class TransactionOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    book_id: int
+    user_id: int
+    book_title: str = Field(validation_alias=AliasPath('book', 'title'))
+    user_name: str = Field(validation_alias=AliasPath('user', 'name'))
+    borrow_date: date
+    due_date: date
+    return_date: Optional[date] = None
+    status: str
+    penalty_fee: Optional[float] = None
+
+class HoldOut(BaseModel):
+    id: int
+    book_id: int
+    user_id: int
+    position: int
+    status: str
+    placed_at: date
+    expires_at: Optional[date] = None
+    ahead: int
+
+class IsbnMatch(BaseModel):
+    isbn: str
+    isbn13: Optional[str] = None
+    book: Optional[BookOut] = None
+
+class Suggestion(BaseModel):
+    type: str
+    id: Union[int, str]
+    label: str
+
+class BookPage(BaseModel):
+    items: List[BookOut]
+    next_cursor: Optional[int] = None
+
+class UserPage(BaseModel):
+    items: List[UserOut]
+    next_cursor: Optional[int] = None
+
+def conditional(*tables):
+    # Route dependency: answers 304 when If-None-Match still matches the
+    # versions of the tables the response is built from, otherwise tags it
+    async def check_etag(request: Request, response: Response, library=Depends(get_library)):
+        etag = await library.run(LibrarySystem.get_etag, *tables)
+        if etag is None:
+            return
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=304, headers={"ETag": f'"{etag}"'})
+        response.headers["ETag"] = f'"{etag}"'
+    return Depends(check_etag)
+
 # API Routes
-@app.get("/")
-async def root():
-    return library.get_system_info()
+@router.get("/")
+async def root(library=Depends(get_library)):
+    return await library.run(LibrarySystem.get_system_info)
+
+@router.get("/stats")
+async def dashboard_stats(library=Depends(get_library)):
+    return await library.run(LibrarySystem.get_dashboard_stats)
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@router.get("/stats/cache")
+async def cache_stats():
+    return entity_cache.stats()
+
+@router.get("/stats/writer")
+async def writer_stats():
+    writer = get_writer()
+    return writer.stats() if writer else {"group_commit": False}
+
+async def ndjson_export(method, serialize):
+    # Walks the table in keyset batches on a session of its own, so the
+    # response streams in constant memory and holds no connection between batches
+    async with open_library() as library:
+        after = None
+        while True:
+            rows, after = await library.run(method, Config.MAX_PAGE_SIZE, after)
+            for line in ndjson_lines(rows, serialize):
+                yield line
+            if after is None:
+                break
 
 # Books endpoints
-@app.post("/books/")
-async def create_book(book: BookCreate):
+@router.post("/books/", response_model=BookOut)
+async def create_book(book: BookCreate, library=Depends(get_library)):
     try:
-        return library.add_book(
+        return await library.run(
+            LibrarySystem.add_book,
             title=book.title,
             author=book.author,
             genre=book.genre,
@@ -50,24 +183,63 @@ async def create_book(book: BookCreate):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/books/")
-async def list_books(search: Optional[str] = None):
+@router.get("/books/", response_model=Union[BookPage, List[BookOut]], dependencies=[conditional("books")])
+async def list_books(search: Optional[str] = None, limit: Optional[int] = None,
+                     after: Optional[int] = None, format: Optional[str] = None,
+                     library=Depends(get_library)):
     if search:
-        return library.search_books(search)
-    return library.session.query(library.models.Book).all()
+        return await library.run(LibrarySystem.search_books, search, limit)
+    if format == "ndjson":
+        return StreamingResponse(ndjson_export(LibrarySystem.list_books, book_to_dict),
+                                 media_type=NDJSON_MEDIA_TYPE)
+    books, next_cursor = await library.run(LibrarySystem.list_books, limit, after)
+    return {"items": books, "next_cursor": next_cursor}
 
-@app.get("/books/{book_id}")
-async def get_book(book_id: int):
-    book = library.session.query(library.models.Book).get(book_id)
+# Lookups by ISBN in any ISBN-10/13 form, matched on the canonical isbn13
+# column. Declared before /books/{book_id} so the path isn't read as an id
+@router.get("/books/by-isbn/{isbn}", response_model=BookOut, dependencies=[conditional("books")])
+async def get_book_by_isbn(isbn: str, library=Depends(get_library)):
+    try:
+        book = await library.run(LibrarySystem.get_book_by_isbn, isbn)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     return book
 
+@router.post("/books/by-isbn", response_model=List[IsbnMatch])
+async def get_books_by_isbn(lookup: IsbnLookup, library=Depends(get_library)):
+    try:
+        return await library.run(LibrarySystem.get_books_by_isbn, lookup.isbns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/books/{book_id}", response_model=BookOut, dependencies=[conditional("books")])
+async def get_book(book_id: int, library=Depends(get_library)):
+    book = await library.run(LibrarySystem.get_book, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book
+
+# Search-box suggestions from the in-memory index. Lookups take microseconds,
+# so they run on the event loop rather than paying for a worker thread hop
+@router.get("/autocomplete", response_model=List[Suggestion])
+async def suggest(q: str, limit: Optional[int] = None, type: Optional[str] = None):
+    if autocomplete.index.needs_build():
+        async with open_library() as library:
+            await library.run(LibrarySystem.rebuild_autocomplete)
+    return autocomplete.index.suggest(q, limit, type.split(",") if type else None)
+
+@router.get("/autocomplete/stats")
+async def autocomplete_stats():
+    return autocomplete.index.memory_usage()
+
 # Users endpoints
-@app.post("/users/")
-async def create_user(user: UserCreate):
+@router.post("/users/", response_model=UserOut)
+async def create_user(user: UserCreate, library=Depends(get_library)):
     try:
-        return library.add_user(
+        return await library.run(
+            LibrarySystem.add_user,
             name=user.name,
             email=user.email,
             student_id=user.student_id,
@@ -76,46 +248,156 @@ async def create_user(user: UserCreate):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/users/")
-async def list_users(search: Optional[str] = None):
+@router.get("/users/", response_model=Union[UserPage, List[UserOut]], dependencies=[conditional("users")])
+async def list_users(search: Optional[str] = None, limit: Optional[int] = None,
+                     after: Optional[int] = None, format: Optional[str] = None,
+                     library=Depends(get_library)):
     if search:
-        return library.search_users(search)
-    return library.session.query(library.models.User).all()
+        return await library.run(LibrarySystem.search_users, search, limit)
+    if format == "ndjson":
+        return StreamingResponse(ndjson_export(LibrarySystem.list_users, user_to_dict),
+                                 media_type=NDJSON_MEDIA_TYPE)
+    users, next_cursor = await library.run(LibrarySystem.list_users, limit, after)
+    return {"items": users, "next_cursor": next_cursor}
 
-@app.get("/users/{user_id}")
-async def get_user(user_id: int):
-    user = library.session.query(library.models.User).get(user_id)
+@router.get("/users/{user_id}", response_model=UserOut, dependencies=[conditional("users")])
+async def get_user(user_id: int, library=Depends(get_library)):
+    user = await library.run(LibrarySystem.get_user, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-@app.get("/users/{user_id}/history")
-async def get_user_history(user_id: int):
-    return library.get_user_history(user_id)
+@router.get("/users/{user_id}/history", response_model=List[TransactionOut],
+         dependencies=[conditional("transactions", "books", "users")])
+async def get_user_history(user_id: int, library=Depends(get_library)):
+    return await library.run(LibrarySystem.get_user_history, user_id)
+
+# Bulk import
+@router.post("/import/{kind}")
+async def import_records(kind: str, request: Request, format: str = "csv",
+                         library=Depends(get_library)):
+    # Body is the raw CSV or JSONL file. It is spooled (to disk once large)
+    # rather than buffered whole, then imported in batched upserts
+    if kind not in IMPORTERS:
+        raise HTTPException(status_code=404, detail=f"Unknown import type: {kind}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    with tempfile.SpooledTemporaryFile(max_size=Config.IMPORT_SPOOL_SIZE) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        return await library.run(LibrarySystem.import_records, kind, upload, format)
 
 # Transactions endpoints
-@app.post("/transactions/borrow")
-async def borrow_book(transaction: TransactionCreate):
+@router.post("/transactions/borrow", response_model=TransactionOut)
+async def borrow_book(transaction: TransactionCreate, library=Depends(get_library)):
     try:
-        return library.borrow_book(
+        return await library.run(
+            LibrarySystem.borrow_book,
             book_id=transaction.book_id,
             user_id=transaction.user_id
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/transactions/{transaction_id}/return")
-async def return_book(transaction_id: int):
+@router.post("/transactions/{transaction_id}/return", response_model=TransactionOut)
+async def return_book(transaction_id: int, library=Depends(get_library)):
+    try:
+        return await library.run(LibrarySystem.return_book, transaction_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/transactions/overdue", response_model=List[TransactionOut],
+         dependencies=[conditional("transactions", "books", "users")])
+async def list_overdue(library=Depends(get_library)):
+    return await library.run(LibrarySystem.get_overdue_books)
+
+# Holds: join a book's queue instead of retrying a checkout; poll the hold
+# until it is "Ready", then borrow as usual within the pickup window
+@router.post("/holds/", response_model=HoldOut)
+async def place_hold(hold: HoldCreate, library=Depends(get_library)):
     try:
-        return library.return_book(transaction_id)
+        return await library.run(LibrarySystem.place_hold, book_id=hold.book_id, user_id=hold.user_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/transactions/overdue")
-async def list_overdue():
-    return library.get_overdue_books()
+@router.get("/holds/{hold_id}", response_model=HoldOut)
+async def get_hold(hold_id: int, library=Depends(get_library)):
+    hold = await library.run(LibrarySystem.get_hold, hold_id)
+    if not hold:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    return hold
+
+@router.delete("/holds/{hold_id}")
+async def cancel_hold(hold_id: int, library=Depends(get_library)):
+    try:
+        await library.run(LibrarySystem.cancel_hold, hold_id)
+    except RecordNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"message": "Hold cancelled"}
+
+@router.get("/books/{book_id}/holds", response_model=List[HoldOut])
+async def get_book_holds(book_id: int, library=Depends(get_library)):
+    return await library.run(LibrarySystem.get_book_holds, book_id)
+
+# Live availability: "book" events carry a book's new shelf count, "loan"
+# events a loan's new status. Reconnecting clients resume from Last-Event-ID;
+# a "reset" event means events were missed and lists should be re-fetched
+@router.get("/events", include_in_schema=False)
+async def event_stream(request: Request, last_event_id: Optional[str] = None):
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(broker.stream(resume_from), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Background jobs
+async def run_periodically(method, interval):
+    while True:
+        try:
+            async with open_library() as library:
+                await library.run(method)
+        except Exception:
+            logger.exception("Background job %s failed", method.__name__)
+        await asyncio.sleep(interval)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Startup work lives here rather than at import, so importing the API
+    # (worker spawn, tooling) never touches the database
+    ran = await run_in_threadpool(startup_schema_check)
+    if ran:
+        logger.info("Applied migrations: %s", ", ".join(ran))
+    await run_in_threadpool(report_pragmas, get_engine())
+    jobs = [(LibrarySystem.accrue_penalties, Config.PENALTY_ACCRUAL_INTERVAL),
+            (LibrarySystem.expire_holds, Config.HOLD_SWEEP_INTERVAL),
+            (LibrarySystem.archive_loans, Config.ARCHIVE_INTERVAL),
+            (LibrarySystem.rebuild_autocomplete, Config.AUTOCOMPLETE_REBUILD_INTERVAL)]
+    tasks = [asyncio.create_task(run_periodically(method, interval))
+             for method, interval in jobs if interval]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await dispose_engines()
+
+def create_app():
+    # Routes declare response models, which FastAPI releases with Pydantic's
+    # direct JSON path serialize fastest on their own. On older releases, which
+    # go through json.dumps, ORJSON_RESPONSES swaps in orjson for that step
+    app = FastAPI(
+        title=Config.LIBRARY_NAME,
+        description="Library Management System API",
+        version=Config.VERSION,
+        lifespan=lifespan,
+        **({'default_response_class': ORJSONResponse}
+           if Config.ORJSON_RESPONSES and orjson is not None else {})
+    )
+    app.add_middleware(metrics.MetricsMiddleware)
+    if Config.PROFILING:
+        app.add_middleware(ASGIProfiler)
+    app.include_router(router)
+    return app
 
-# Cleanup
-@app.on_event("shutdown")
-async def shutdown_event():
-    library.close()
+# uvicorn library_system.api:app, or --factory library_system.api:create_app
+# to pick up Config changes made after import
+app = create_app()
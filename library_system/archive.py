@@ -0,0 +1,119 @@
+import argparse
+import heapq
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, literal, select
+from .config import Config
+from .circulation import run_atomically
+from .etags import touch
+
+# Hot/cold split of the loan table. Returned loans older than
+# Config.ARCHIVE_AFTER_DAYS move to an archive table with the same columns,
+# so the live table only holds open loans and recent returns, and the
+# overdue sweep, dashboard recounts and loan listings stay the same size
+# however many years of history are kept. With Config.ARCHIVE_DATABASE set
+# the archive lives in a separate SQLite file, attached to every connection
+# as "archive".
+#
+# Loans move in batches of ARCHIVE_BATCH_SIZE, each its own short write
+# transaction, so returns and checkouts get the write lock between batches.
+# History reads merge the live and archived rows (see merged_history). As in
+# circulation.py, the model classes are passed in.
+
+SCHEMA = 'archive'
+
+
+def archive_schema():
+    # Table args for the archive model
+    return {'schema': SCHEMA} if Config.ARCHIVE_DATABASE else {}
+
+
+def attach_archive(engine, path=None):
+    # Attaches the archive file to every pooled connection. False when the
+    # archive shares the main database
+    path = path or Config.ARCHIVE_DATABASE
+    engine = getattr(engine, 'sync_engine', engine)
+    if not path:
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def attach(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (path,))
+        finally:
+            cursor.close()
+    return True
+
+
+def archive_returned(session, Transaction, Archive, Stat=None, older_than_days=None,
+                     batch_size=None, today=None, pause=0.0):
+    # Moves returned loans whose return date is past the cutoff. Returns how
+    # many moved. Commits each batch
+    older_than_days = Config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+    today = today or datetime.utcnow().date()
+    cutoff = today - timedelta(days=older_than_days)
+    live, archived = Transaction.__table__, Archive.__table__
+    columns = [column.name for column in live.columns]
+
+    def move_batch():
+        # The batch is bounded by id, so the copy and the delete cover
+        # exactly the same rows without a long IN list
+        ids = session.query(Transaction.id).filter(
+            Transaction.status == "Returned",
+            Transaction.return_date < cutoff
+        ).order_by(Transaction.id).limit(batch_size).all()
+        if not ids:
+            return 0
+        batch = ((live.c.status == "Returned") & (live.c.return_date < cutoff)
+                 & (live.c.id <= ids[-1][0]))
+        session.execute(archived.insert().from_select(
+            columns + ['archived_at'],
+            select(*[live.c[name] for name in columns], literal(today)).where(batch)
+        ))
+        session.execute(live.delete().where(batch))
+        if Stat is not None:
+            touch(session, Stat, 'transactions')
+        return len(ids)
+
+    moved = 0
+    while True:
+        count = run_atomically(session, move_batch)
+        moved += count
+        if count < batch_size:
+            return moved
+        if pause:
+            time.sleep(pause)
+
+
+def merged_history(live_rows, archived_rows):
+    # Both newest first (ties by id), as the history queries return them
+    return list(heapq.merge(live_rows, archived_rows, key=lambda row: (row.borrow_date, row.id), reverse=True))
+
+
+def main(argv=None):
+    from .models import startup_schema_check
+    from .operations import LibrarySystem
+
+    parser = argparse.ArgumentParser(description="Move old returned loans to the archive")
+    parser.add_argument('--older-than', type=int, default=None,
+                        help=f"Days since return (default {Config.ARCHIVE_AFTER_DAYS})")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help=f"Loans per transaction (default {Config.ARCHIVE_BATCH_SIZE})")
+    parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches")
+    args = parser.parse_args(argv)
+
+    startup_schema_check()
+    library = LibrarySystem()
+    try:
+        moved = library.archive_loans(args.older_than, args.batch_size, pause=args.pause)
+    finally:
+        library.close()
+    print(f"{moved} loans archived")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
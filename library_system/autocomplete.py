@@ -0,0 +1,224 @@
+import re
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from .config import Config
+
+# In-process prefix index for the search box. Book titles, authors and member
+# names are split into normalized tokens (lower case, accents stripped) kept
+# in one sorted list; a prefix is a bisect into that list, and each token maps
+# to the suggestions that contain it. Lookups never touch the database.
+#
+# The index is built from the database once (at API startup, or by the first
+# lookup) and then kept current by the write paths: add/update/remove after
+# each commit. Each process holds its own copy, so writes made by another
+# worker show up at the next periodic rebuild (AUTOCOMPLETE_REBUILD_INTERVAL).
+#
+# A suggestion is (kind, key, label): ('book', id, title), ('user', id, name)
+# or ('author', normalized name, name); one author entry covers all their
+# books. memory_usage() estimates what the structures cost.
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text):
+    text = text or ''
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return _WORD.findall(normalize(text))
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._tokens = []  # sorted, unique
+        self._postings = {}  # token -> sorted list of suggestion ids
+        self._entries = {}  # (kind, key) -> [label, tokens, references]
+        self._lock = threading.Lock()
+        self.built_at = None
+
+    def _add(self, kind, key, label, keep_sorted=True):
+        entry = self._entries.get((kind, key))
+        if entry is not None:
+            # Authors are shared by several books
+            entry[2] += 1
+            return
+        ident = (kind, key)
+        # A small tuple costs a fraction of a frozenset, and is only scanned
+        # for multi-word queries
+        tokens = tuple(sorted(set(tokenize(label))))
+        self._entries[ident] = [label, tokens, 1]
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = []
+                if keep_sorted:
+                    insort(self._tokens, token)
+            if keep_sorted:
+                insort(postings, ident)
+            else:
+                postings.append(ident)
+
+    def _remove(self, kind, key):
+        entry = self._entries.get((kind, key))
+        if entry is None:
+            return
+        entry[2] -= 1
+        if entry[2] > 0:
+            return
+        del self._entries[(kind, key)]
+        for token in entry[1]:
+            postings = self._postings[token]
+            del postings[bisect_left(postings, (kind, key))]
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+
+    def _book_entries(self, book_id, title, author):
+        yield 'book', book_id, title
+        if author:
+            yield 'author', normalize(author), author
+
+    def add_book(self, book_id, title, author):
+        with self._lock:
+            for entry in self._book_entries(book_id, title, author):
+                self._add(*entry)
+
+    def remove_book(self, book_id, title, author):
+        with self._lock:
+            for kind, key, _ in self._book_entries(book_id, title, author):
+                self._remove(kind, key)
+
+    def add_user(self, user_id, name):
+        with self._lock:
+            self._add('user', user_id, name)
+
+    def remove_user(self, user_id):
+        with self._lock:
+            self._remove('user', user_id)
+
+    def update_book(self, book_id, old, new):
+        # old and new are (title, author)
+        with self._lock:
+            for kind, key, _ in self._book_entries(book_id, *old):
+                self._remove(kind, key)
+            for entry in self._book_entries(book_id, *new):
+                self._add(*entry)
+
+    def update_user(self, user_id, name):
+        with self._lock:
+            self._remove('user', user_id)
+            self._add('user', user_id, name)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def needs_build(self, max_age=None):
+        # Never built, or (with max_age) built longer ago than that
+        if self.built_at is None:
+            return True
+        return bool(max_age) and time.time() - self.built_at > max_age
+
+    def mark_stale(self):
+        # After bulk changes: the next lookup (or rebuild job) reloads
+        self.built_at = None
+
+    def load(self, books, users):
+        # books: (id, title, author) rows, users: (id, name). Builds a fresh
+        # index off to the side and swaps it in. Sorted once at the end
+        # rather than kept sorted insert by insert
+        fresh = PrefixIndex()
+        for book_id, title, author in books:
+            for entry in fresh._book_entries(book_id, title, author):
+                fresh._add(*entry, keep_sorted=False)
+        for user_id, name in users:
+            fresh._add('user', user_id, name, keep_sorted=False)
+        fresh._tokens = sorted(fresh._postings)
+        for postings in fresh._postings.values():
+            postings.sort()
+        with self._lock:
+            self._tokens, self._postings, self._entries = fresh._tokens, fresh._postings, fresh._entries
+            self.built_at = time.time()
+
+    def suggest(self, query, limit=None, kinds=None):
+        # Every word but the last must appear whole; the last is a prefix.
+        # Suggestions come in token order, so exact words rank before longer
+        # ones, then by kind and id
+        words = tokenize(query)
+        if not words:
+            return []
+        *whole, prefix = words
+        limit = min(limit or Config.AUTOCOMPLETE_LIMIT, Config.AUTOCOMPLETE_MAX_LIMIT)
+        results, seen, scanned = [], set(), 0
+        with self._lock:
+            if any(word not in self._postings for word in whole):
+                return []
+            index = bisect_left(self._tokens, prefix)
+            while index < len(self._tokens) and len(results) < limit:
+                token = self._tokens[index]
+                if not token.startswith(prefix):
+                    break
+                for suggestion in self._postings[token]:
+                    scanned += 1
+                    if suggestion in seen or (kinds and suggestion[0] not in kinds):
+                        continue
+                    label, tokens, _ = self._entries[suggestion]
+                    if all(word in tokens for word in whole):
+                        seen.add(suggestion)
+                        results.append({'type': suggestion[0], 'id': suggestion[1], 'label': label})
+                        if len(results) >= limit:
+                            break
+                if scanned >= Config.AUTOCOMPLETE_MAX_SCAN:
+                    break
+                index += 1
+        return results
+
+    def memory_usage(self):
+        # Estimated bytes held by the index, shared objects counted once
+        with self._lock:
+            seen = set()
+            total = 0
+
+            def size(obj):
+                nonlocal total
+                if id(obj) not in seen:
+                    seen.add(id(obj))
+                    total += sys.getsizeof(obj)
+
+            size(self._tokens)
+            size(self._postings)
+            size(self._entries)
+            for token in self._tokens:
+                size(token)
+            for postings in self._postings.values():
+                size(postings)
+                for ident in postings:
+                    size(ident)
+            for suggestion, entry in self._entries.items():
+                size(suggestion)
+                size(suggestion[1])
+                size(entry)
+                size(entry[0])
+                size(entry[1])
+            counts = {'tokens': len(self._tokens), 'suggestions': len(self._entries)}
+        return dict(counts, bytes=total,
+                    bytes_per_suggestion=round(total / counts['suggestions'], 1) if counts['suggestions'] else 0,
+                    built_at=self.built_at)
+
+
+# The API's index; the Flask app keeps its own over its own tables
+index = PrefixIndex()
+
+
+def build(index, session, Book, User):
+    # Reads only the indexed columns, in batches
+    books = session.query(Book.id, Book.title, Book.author).yield_per(Config.STREAM_BATCH_SIZE)
+    users = session.query(User.id, User.name).yield_per(Config.STREAM_BATCH_SIZE)
+    index.load(books, users)
+    return index
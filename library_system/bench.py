@@ -0,0 +1,373 @@
+import abc
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+import sqlalchemy
+from sqlalchemy import select
+from .config import Config
+from .datagen import TITLE_WORDS, add_arguments, generate_from_args
+from .querycount import QueryCounter
+from . import stats
+
+# Load benchmark for the Flask app (app.py) and the FastAPI service
+# (library_system/api.py). Each target gets a scratch SQLite database seeded
+# by library_system.datagen, then request mixes are driven through the app
+# in-process (WSGI test client / ASGI transport) at each concurrency level.
+# Latency percentiles, throughput and SQL statements per request are written
+# as JSON so runs can be compared:
+#
+#   python -m library_system.bench --books 20000 --loans 100000 --concurrency 1,8,32 \
+#       --output before.json
+#   python -m library_system.bench ... --output after.json --baseline before.json
+#
+# SQL per request is exact per operation only at concurrency 1; concurrent
+# runs report the run-wide average.
+
+MIXES = {
+    'browse': {'list_books': 4, 'get_book': 4, 'list_users': 1, 'get_user': 1},
+    'search': {'search_books': 1},
+    'circulation': {'borrow': 1, 'return_book': 1},
+    'history': {'user_history': 3, 'list_transactions': 2, 'get_transaction': 2, 'overdue': 1},
+}
+
+
+def seed(engine, Book, User, Transaction, args):
+    # Returns the ids of the open loans, which the return operation consumes
+    generate_from_args(engine, Book, User, Transaction, args)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(
+            select(Transaction.id).where(Transaction.status != 'Returned').order_by(Transaction.id))]
+
+
+class Target(abc.ABC):
+    # One app under test: its routes, the engine to count statements on and
+    # a run(plan, concurrency) returning [(op, status, seconds, statements)]
+    # plus the run's total statement count
+    name = None
+    routes = {}
+
+    def __init__(self, path, args, rng):
+        self.path = path
+        self.args = args
+        self.sizes = {'books': args.books, 'users': args.users, 'loans': args.loans}
+        self.rng = rng
+        self.open_loans = []
+
+    def build(self, op):
+        # (method, path, json body), or None if the app has no such endpoint
+        rng, sizes = self.rng, self.sizes
+        route = self.routes.get(op)
+        if route is None:
+            return None
+        method, template = route
+        if op == 'return_book':
+            if not self.open_loans:
+                return None
+            return method, template.format(id=self.open_loans.pop()), None
+        if op == 'borrow':
+            return method, template, {'book_id': rng.randint(1, sizes['books']),
+                                      'user_id': rng.randint(1, sizes['users'])}
+        ids = {'books': sizes['books'], 'users': sizes['users'], 'loans': sizes['loans']}
+        return method, template.format(
+            book_id=rng.randint(1, ids['books']),
+            user_id=rng.randint(1, ids['users']),
+            id=rng.randint(1, ids['loans']),
+            after=rng.randint(0, max(ids['books'], ids['users']) // 2),
+            word=rng.choice(TITLE_WORDS).lower()[:rng.randint(3, 6)],
+        ), None
+
+    def plan(self, mix, count):
+        weights = {op: weight for op, weight in MIXES[mix].items() if op in self.routes}
+        if not weights:
+            return None
+        ops = self.rng.choices(list(weights), weights=list(weights.values()), k=count)
+        return [(op, request) for op in ops for request in [self.build(op)] if request is not None]
+
+    @abc.abstractmethod
+    def engines(self):
+        pass
+
+    @abc.abstractmethod
+    def run(self, plan, concurrency):
+        pass
+
+
+class FlaskTarget(Target):
+    name = 'flask'
+    routes = {
+        'list_books': ('GET', '/api/books?limit=50&after={after}'),
+        'get_book': ('GET', '/api/books/{book_id}'),
+        'list_users': ('GET', '/api/users?limit=50&after={after}'),
+        'get_user': ('GET', '/api/users/{user_id}'),
+        'borrow': ('POST', '/api/transactions'),
+        'return_book': ('POST', '/api/transactions/{id}/return'),
+        'list_transactions': ('GET', '/api/transactions?limit=50&after={after}'),
+        'get_transaction': ('GET', '/api/transactions/{id}'),
+    }
+
+    def setup(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if root not in sys.path:
+            sys.path.insert(0, root)
+        self.module = importlib.import_module('app')
+        module = self.module
+        module.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{self.path}"
+        with module.app.app_context():
+            module.db.create_all()
+            module.migrate(module.db.engine, module.MIGRATIONS)
+            self.open_loans = seed(module.db.engine, module.Book, module.User, module.Transaction, self.args)
+            stats.reconcile(module.db.session, module.Stat, module.Book, module.User, module.Transaction)
+
+    def engines(self):
+        with self.module.app.app_context():
+            return [self.module.db.engine]
+
+    def run(self, plan, concurrency):
+        app = self.module.app
+        results = []
+        lock = threading.Lock()
+        pending = iter(plan)
+
+        def worker(counter):
+            client = app.test_client()
+            while True:
+                with lock:
+                    item = next(pending, None)
+                if item is None:
+                    return
+                op, (method, path, body) = item
+                before = counter.count
+                started = time.perf_counter()
+                response = client.open(path, method=method, json=body)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    results.append((op, response.status_code, elapsed, counter.count - before))
+
+        with QueryCounter(self.engines()[0]) as counter:
+            threads = [threading.Thread(target=worker, args=(counter,)) for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results, counter.count
+
+
+class FastAPITarget(Target):
+    name = 'fastapi'
+    routes = {
+        'list_books': ('GET', '/books/?limit=50&after={after}'),
+        'get_book': ('GET', '/books/{book_id}'),
+        'list_users': ('GET', '/users/?limit=50&after={after}'),
+        'get_user': ('GET', '/users/{user_id}'),
+        'search_books': ('GET', '/books/?search={word}&limit=20'),
+        'borrow': ('POST', '/transactions/borrow'),
+        'return_book': ('POST', '/transactions/{id}/return'),
+        'user_history': ('GET', '/users/{user_id}/history'),
+        'overdue': ('GET', '/transactions/overdue'),
+    }
+
+    def setup(self):
+        import httpx
+        # The engine is built from Config on first use
+        Config.DATABASE_URL = f"sqlite:///{self.path}"
+        Config.ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{self.path}"
+        from . import models, sessions
+        from .api import app
+        self.httpx, self.app, self.models, self.sessions = httpx, app, models, sessions
+        # The ASGI transport doesn't run the app's lifespan, so no startup schema check
+        models.ensure_schema()
+        self.open_loans = seed(models.get_engine(), models.Book, models.User, models.Transaction, self.args)
+        session = models.get_session()
+        stats.reconcile(session, models.Stat, models.Book, models.User, models.Transaction)
+        session.close()
+
+    def engines(self):
+        if Config.ASYNC_ENGINE:
+            self.sessions.get_async_sessionmaker()
+            return [self.sessions._async_engine.sync_engine]
+        return [self.models.get_engine()]
+
+    def run(self, plan, concurrency):
+        results = []
+        pending = iter(plan)
+
+        async def worker(client, counter):
+            for op, (method, path, body) in pending:
+                before = counter.count
+                started = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                elapsed = time.perf_counter() - started
+                results.append((op, response.status_code, elapsed, counter.count - before))
+
+        async def main(counter):
+            transport = self.httpx.ASGITransport(app=self.app)
+            async with self.httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                await asyncio.gather(*(worker(client, counter) for _ in range(concurrency)))
+
+        with QueryCounter(self.engines()[0]) as counter:
+            asyncio.run(main(counter))
+        return results, counter.count
+
+
+TARGETS = {'flask': FlaskTarget, 'fastapi': FastAPITarget}
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+
+def summarize(results, elapsed, statements):
+    # statements is None when requests overlapped and can't be told apart
+    latencies = sorted(seconds * 1000 for _, _, seconds, _ in results)
+    summary = {
+        'requests': len(results),
+        'rps': round(len(results) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'sql_per_request': None if statements is None else round(statements / len(results), 2),
+        'status': dict(Counter(str(status) for _, status, _, _ in results)),
+    }
+    return summary
+
+
+def run_target(name, args):
+    rng = random.Random(args.seed)
+    path = os.path.join(tempfile.mkdtemp(), f'bench-{name}.db')
+    target = TARGETS[name](path, args, rng)
+    started = time.perf_counter()
+    try:
+        target.setup()
+    except Exception as e:
+        # e.g. only one of the two stacks installs cleanly in this environment
+        print(f"{name:8} skipped: {type(e).__name__}: {e}")
+        return {'error': f"{type(e).__name__}: {e}"}, []
+    seeded = round(time.perf_counter() - started, 2)
+
+    runs = []
+    for mix in args.mix:
+        for concurrency in args.concurrency:
+            warmup = target.plan(mix, args.warmup)
+            if warmup is None:
+                runs.append({'target': name, 'mix': mix, 'concurrency': concurrency,
+                             'skipped': 'no matching endpoints'})
+                print(format_run(runs[-1]), flush=True)
+                continue
+            target.run(warmup, concurrency)
+            plan = target.plan(mix, args.requests)
+            if not plan:
+                runs.append({'target': name, 'mix': mix, 'concurrency': concurrency,
+                             'skipped': 'no requests left to run'})
+                print(format_run(runs[-1]), flush=True)
+                continue
+            started = time.perf_counter()
+            results, statements = target.run(plan, concurrency)
+            elapsed = time.perf_counter() - started
+            run = {'target': name, 'mix': mix, 'concurrency': concurrency,
+                   'duration_s': round(elapsed, 3)}
+            run.update(summarize(results, elapsed, statements))
+            run['ops'] = {}
+            for op in sorted({op for op, _, _, _ in results}):
+                selected = [result for result in results if result[0] == op]
+                op_statements = sum(result[3] for result in selected) if concurrency == 1 else None
+                run['ops'][op] = summarize(selected, None, op_statements)
+                del run['ops'][op]['rps']
+            runs.append(run)
+            print(format_run(run), flush=True)
+    return {'seed_seconds': seeded, 'database': path}, runs
+
+
+def format_run(run, baseline=None):
+    line = f"{run['target']:8} {run['mix']:12} c={run['concurrency']:<4}"
+    if 'skipped' in run:
+        return f"{line} skipped: {run['skipped']}"
+    latency = run['latency_ms']
+    line += (f" {run['rps']:>8} req/s  p50 {latency['p50']:>8.2f}ms  p95 {latency['p95']:>8.2f}ms"
+             f"  p99 {latency['p99']:>8.2f}ms  sql/req {run['sql_per_request']}")
+    if baseline:
+        line += (f"  (req/s x{run['rps'] / baseline['rps']:.2f},"
+                 f" p95 x{latency['p95'] / baseline['latency_ms']['p95']:.2f})")
+    return line
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(run['target'], run['mix'], run['concurrency']): run
+                for run in baseline['runs'] if 'skipped' not in run}
+    print(f"\nAgainst {baseline_path}:")
+    for run in report['runs']:
+        key = (run['target'], run['mix'], run['concurrency'])
+        if 'skipped' not in run and key in previous:
+            print(format_run(run, previous[key]))
+
+
+def integers(value):
+    return [int(part) for part in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency/throughput benchmark for the Flask and FastAPI apps")
+    parser.add_argument('--target', choices=['flask', 'fastapi', 'both'], default='both')
+    add_arguments(parser)
+    parser.add_argument('--mix', type=lambda value: value.split(','), default=list(MIXES),
+                        help=f"Comma-separated mixes from: {', '.join(MIXES)}")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per mix and concurrency level")
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--concurrency', type=integers, default=[1, 8],
+                        help="Comma-separated client counts")
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--baseline', help="Earlier results file to compare against")
+    parser.add_argument('--group-commit', action='store_true',
+                        help="Run writes through the group-commit writer (Config.GROUP_COMMIT)")
+    args = parser.parse_args(argv)
+    Config.GROUP_COMMIT = Config.GROUP_COMMIT or args.group_commit
+
+    unknown = [mix for mix in args.mix if mix not in MIXES]
+    if unknown:
+        parser.error(f"unknown mix: {', '.join(unknown)}")
+
+    report = {
+        'meta': {
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'args': {key: str(value) if key == 'as_of' else value
+                     for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        },
+        'targets': {},
+        'runs': [],
+    }
+    for name in (['flask', 'fastapi'] if args.target == 'both' else [args.target]):
+        info, runs = run_target(name, args)
+        report['targets'][name] = info
+        report['runs'].extend(runs)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        compare(report, args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from sqlalchemy import inspect
+from .config import Config
+
+# Read-through cache of book and user rows keyed by (table, primary key).
+# Entries are column snapshots, not ORM instances, so they can be shared
+# between sessions and threads; callers get a fresh SimpleNamespace copy.
+# Write paths invalidate the keys they touch after committing, and the TTL
+# bounds staleness across worker processes, which each hold their own cache.
+# Conditional GETs go further and drop a table's entries as soon as they see
+# its version move (sync_versions).
+
+_MISSING = object()
+
+
+class EntityCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_table(self, table):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == table]:
+                del self._entries[key]
+
+    def sync_version(self, table, version):
+        # Another process may have written the table since its rows were
+        # cached; a version we haven't seen means our snapshots can't be trusted
+        with self._lock:
+            if self._versions.get(table) != version:
+                for key in [key for key in self._entries if key[0] == table]:
+                    del self._entries[key]
+                self._versions[table] = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+entity_cache = EntityCache(Config.ENTITY_CACHE_SIZE, Config.ENTITY_CACHE_TTL)
+
+# Rendered HTML table fragments of the Flask listing pages. Keys carry the
+# data versions the fragment was built from, so a write simply makes older
+# entries unreachable and they age out
+fragment_cache = EntityCache(Config.FRAGMENT_CACHE_SIZE, Config.FRAGMENT_CACHE_TTL)
+
+
+def cached(cache, key, build):
+    # Read-through: build() on a miss, its result kept under key
+    value = cache.get(key)
+    if value is _MISSING:
+        value = build()
+        cache.set(key, value)
+    return value
+
+
+def load_record(session, model, pk):
+    # Returns a snapshot of the row, or None if it doesn't exist
+    key = (model.__tablename__, int(pk))
+    record = entity_cache.get(key)
+    if record is _MISSING:
+        instance = session.get(model, pk)
+        if instance is None:
+            return None
+        record = {attr.key: getattr(instance, attr.key) for attr in inspect(model).column_attrs}
+        entity_cache.set(key, record)
+    return SimpleNamespace(**record)
+
+
+def invalidate(model, *pks):
+    for pk in pks:
+        entity_cache.invalidate((model.__tablename__, int(pk)))
+
+
+def invalidate_all(model):
+    entity_cache.invalidate_table(model.__tablename__)
+
+
+def sync_versions(versions, models):
+    # Called with freshly read table versions (see etags.py) before serving
+    # data, so a conditional response is never built from a stale snapshot
+    for table, version in versions.items():
+        model = models.get(table)
+        if model is not None:
+            entity_cache.sync_version(model.__tablename__, version)
@@ -0,0 +1,92 @@
+import random
+import time
+from sqlalchemy.exc import OperationalError
+from .config import Config
+
+# Checkout and return as single-statement conditional UPDATEs. The check and
+# the write happen in one statement under the database's write lock, so two
+# concurrent checkouts can never both take the last copy. The model classes
+# are passed in so the Flask app, LibrarySystem and LibraryOperations can all
+# share this code over their own mappings.
+
+
+OPEN_STATUSES = ("Borrowed", "Overdue")
+
+
+class RecordNotFound(ValueError):
+    pass
+
+
+def _is_busy(error):
+    message = str(error.orig).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def run_atomically(session, work, retries=None):
+    # Runs work() and commits it as one transaction, retrying with jittered
+    # exponential backoff when SQLite reports the database is busy
+    retries = Config.BUSY_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            result = work()
+            session.commit()
+            return result
+        except OperationalError as e:
+            session.rollback()
+            if attempt == retries or not _is_busy(e):
+                raise
+            time.sleep(Config.BUSY_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+        except Exception:
+            session.rollback()
+            raise
+
+
+def reserve_copy(session, Book, User, book_id, user_id, max_loans=None):
+    # Takes one copy off the shelf and counts it against the borrower
+    taken = session.query(Book).filter(
+        Book.id == book_id,
+        Book.quantity > 0
+    ).update({Book.quantity: Book.quantity - 1}, synchronize_session=False)
+    if not taken:
+        if session.get(Book, book_id) is None:
+            raise RecordNotFound("Book or user not found")
+        raise ValueError("Book not available")
+
+    count_loan(session, User, user_id, max_loans)
+
+
+def count_loan(session, User, user_id, max_loans=None):
+    # Counts one more loan against the borrower, within max_loans
+    borrower = session.query(User).filter(User.id == user_id)
+    if max_loans is not None:
+        borrower = borrower.filter(User.books_loaned < max_loans)
+    counted = borrower.update({User.books_loaned: User.books_loaned + 1}, synchronize_session=False)
+    if not counted:
+        if session.get(User, user_id) is None:
+            raise RecordNotFound("Book or user not found")
+        raise ValueError(f"User has reached maximum number of books allowed ({max_loans})")
+
+
+def release_copy(session, Book, User, Transaction, transaction_id, return_date):
+    # Closes the loan only if it is still open, so a double return can't put
+    # an extra copy back on the shelf. Returns the refreshed transaction and
+    # the status it was closed from
+    for previous_status in OPEN_STATUSES:
+        closed = session.query(Transaction).filter(
+            Transaction.id == transaction_id,
+            Transaction.status == previous_status
+        ).update({Transaction.status: "Returned", Transaction.return_date: return_date},
+                 synchronize_session=False)
+        if closed:
+            break
+    else:
+        if session.get(Transaction, transaction_id) is None:
+            raise RecordNotFound("Transaction not found")
+        raise ValueError("Book already returned")
+
+    transaction = session.get(Transaction, transaction_id, populate_existing=True)
+    session.query(Book).filter(Book.id == transaction.book_id).update(
+        {Book.quantity: Book.quantity + 1}, synchronize_session=False)
+    session.query(User).filter(User.id == transaction.user_id).update(
+        {User.books_loaned: User.books_loaned - 1}, synchronize_session=False)
+    return transaction, previous_status
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Cold-start measurement: what a fresh worker pays before it can serve. Each
+# sample runs in a new interpreter, importing one module (and optionally
+# starting the API through its lifespan) against a scratch database path, and
+# reports the time taken and whether the import alone touched the database.
+# -X importtime then lists the modules that cost the most.
+#
+#   python -m library_system.coldstart --runs 5 --startup
+
+MODULES = ['library_system.models', 'library_system.operations', 'library_system.api']
+
+_SAMPLE = '''
+import json, os, sys, time
+started = time.perf_counter()
+from library_system.config import Config
+path = sys.argv[2]
+Config.DATABASE_URL = f"sqlite:///{path}"
+Config.ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{path}"
+Config.PENALTY_ACCRUAL_INTERVAL = 0
+Config.HOLD_SWEEP_INTERVAL = 0
+Config.ARCHIVE_INTERVAL = 0
+Config.AUTOCOMPLETE_REBUILD_INTERVAL = 0
+import importlib
+module = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+result = {"import_ms": (imported - started) * 1000, "touched_db": os.path.exists(path)}
+if sys.argv[3] == "1":
+    import asyncio
+    async def start():
+        async with module.app.router.lifespan_context(module.app):
+            pass
+    asyncio.run(start())
+    result["startup_ms"] = (time.perf_counter() - imported) * 1000
+print(json.dumps(result))
+'''
+
+
+def _root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sample(module, startup=False):
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, 'coldstart.db')
+        output = subprocess.run(
+            [sys.executable, '-c', _SAMPLE, module, path, '1' if startup else '0'],
+            cwd=_root(), capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_costs(module, top=10):
+    # [(cumulative_ms, module)] from -X importtime, most expensive first
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=_root(), capture_output=True, text=True, check=True
+    ).stderr
+    costs = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        costs.append((int(cumulative) / 1000, name.strip()))
+    return sorted(costs, reverse=True)[:top]
+
+
+def measure(modules, runs, startup=False, top=10):
+    results = {}
+    for module in modules:
+        samples = [sample(module, startup and module == 'library_system.api') for _ in range(runs)]
+        result = {
+            'import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+            'touched_db': any(s['touched_db'] for s in samples),
+            'slowest_imports': [{'module': name, 'cumulative_ms': round(ms, 1)}
+                                for ms, name in import_costs(module, top)],
+        }
+        if 'startup_ms' in samples[0]:
+            result['startup_ms'] = round(statistics.median(s['startup_ms'] for s in samples), 1)
+        results[module] = result
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import and startup time in fresh interpreters")
+    parser.add_argument('--module', action='append', dest='modules',
+                        help=f"Module to import (repeatable; default: {', '.join(MODULES)})")
+    parser.add_argument('--runs', type=int, default=5, help="Samples per module; the median is reported")
+    parser.add_argument('--startup', action='store_true',
+                        help="Also time the API's lifespan startup (schema check, pragma report)")
+    parser.add_argument('--top', type=int, default=10, help="Slowest imports to list")
+    parser.add_argument('--output', help="Also write the results here as JSON")
+    args = parser.parse_args(argv)
+
+    results = measure(args.modules or MODULES, args.runs, args.startup, args.top)
+    for module, result in results.items():
+        line = f"{module}: import {result['import_ms']} ms"
+        if 'startup_ms' in result:
+            line += f", startup {result['startup_ms']} ms"
+        if result['touched_db']:
+            line += " (touched the database on import)"
+        print(line)
+        for entry in result['slowest_imports']:
+            print(f"    {entry['cumulative_ms']:>8} ms  {entry['module']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if any(result['touched_db'] for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
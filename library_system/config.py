@@ -1,6 +1,32 @@
 class Config:
     # Database Configuration
     DATABASE_URL = 'sqlite:///library.db'
+    ASYNC_DATABASE_URL = 'sqlite+aiosqlite:///library.db'
+    ASYNC_ENGINE = False  # Run API queries through aiosqlite instead of the worker thread pool
+
+    # Connection Pool
+    POOL_SIZE = 5
+    MAX_OVERFLOW = 10
+    POOL_TIMEOUT = 30  # Seconds to wait for a free connection
+    POOL_RECYCLE = 1800  # Seconds before a pooled connection is replaced
+    POOL_PRE_PING = True
+    BUSY_RETRIES = 5  # Attempts after "database is locked" before giving up
+    BUSY_RETRY_BACKOFF = 0.01  # Seconds, doubled on every retry
+
+    # Group commit (library_system/writer.py); not used with ASYNC_ENGINE
+    GROUP_COMMIT = False  # Hand request writes to one writer thread that commits them in batches
+    GROUP_COMMIT_WINDOW = 0.002  # Seconds the writer waits for more writes to join a batch
+    GROUP_COMMIT_MAX_BATCH = 64  # Writes per transaction at most
+
+    # SQLite tuning, applied to every new connection (library_system/pragmas.py)
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 5000,  # Milliseconds a writer waits for the lock before "database is locked"
+        'journal_mode': 'WAL',  # Readers aren't blocked by a committing writer
+        'synchronous': 'NORMAL',  # With WAL, fsync only at checkpoints
+        'cache_size': -65536,  # Negative means KiB: 64 MB page cache per connection
+        'mmap_size': 268435456,  # Read the first 256 MB of the file through a memory map
+        'temp_store': 'MEMORY',
+    }
     
     # System Information
     LIBRARY_NAME = "SDCKL Library"  # You can change this to your preferred library name
@@ -11,6 +37,76 @@ class Config:
     LOAN_PERIOD_DAYS = 14
     PENALTY_RATE = 5.00  # RM per day
     MAX_PENALTY = 50.00  # RM
+    PENALTY_ACCRUAL_INTERVAL = 24 * 3600  # Seconds between overdue/fine runs in the API process; 0 disables
+    HOLD_PICKUP_DAYS = 3  # Days a copy set aside for a hold waits to be collected
+    HOLD_SWEEP_INTERVAL = 3600  # Seconds between sweeps of uncollected holds in the API process; 0 disables
+
+    # List endpoints
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
+    STREAM_BATCH_SIZE = 1000  # Rows fetched per round trip in NDJSON exports
+
+    # Bulk import
+    IMPORT_BATCH_SIZE = 5000  # Rows per executemany / transaction
+    IMPORT_MAX_ERRORS = 1000  # Row errors listed in the report (all are counted)
+    IMPORT_SPOOL_SIZE = 8 * 1024 * 1024  # Upload bytes kept in memory before spilling to disk
+
+    # Entity cache (per process; the TTL bounds staleness across workers)
+    ENTITY_CACHE_SIZE = 10000  # Book/user rows kept; 0 disables caching
+    ENTITY_CACHE_TTL = 300  # Seconds
+
+    # Flask listing pages (/books, /users, /transactions)
+    HTML_PAGE_SIZE = 50  # Rows per page unless ?limit= asks otherwise (up to MAX_PAGE_SIZE)
+    FRAGMENT_CACHE_SIZE = 500  # Rendered table fragments kept; 0 disables caching
+    FRAGMENT_CACHE_TTL = 600  # Seconds
+    COMPRESS_MIN_SIZE = 1024  # Bytes; smaller HTML/JSON responses go out uncompressed
+    COMPRESS_LEVEL = 6  # gzip level, 1 (fastest) to 9 (smallest)
+
+    # Dashboard
+    STATS_RECONCILE_INTERVAL = 3600  # Seconds between full recounts of the dashboard counters
+
+    # JSON encoding
+    ORJSON = True  # Encode NDJSON exports and Flask responses with orjson when installed
+    ORJSON_RESPONSES = False  # Default FastAPI response class; see library_system/api.py
+
+    # Startup
+    SCHEMA_CHECK = True  # Create/migrate at API startup; off when deploys run library_system.migrations
+
+    # Metrics (/metrics, Prometheus text format)
+    METRICS = True
+    SLOW_QUERY_THRESHOLD = 0.25  # Seconds; slower statements are logged and counted
+
+    # Archival of returned loans (library_system/archive.py)
+    ARCHIVE_AFTER_DAYS = 365  # Returned loans older than this leave the live transactions table
+    ARCHIVE_BATCH_SIZE = 5000  # Loans moved per write transaction
+    ARCHIVE_DATABASE = None  # Separate SQLite file for the archive (attached as "archive"); None keeps it in the main one
+    ARCHIVE_INTERVAL = 24 * 3600  # Seconds between archival runs in the API process; 0 disables
+
+    # Autocomplete (library_system/autocomplete.py)
+    AUTOCOMPLETE_LIMIT = 10  # Suggestions returned by default
+    AUTOCOMPLETE_MAX_LIMIT = 50
+    AUTOCOMPLETE_MAX_SCAN = 5000  # Index entries examined per lookup at most, bounding one-letter prefixes
+    AUTOCOMPLETE_REBUILD_INTERVAL = 600  # Seconds between rebuilds that pick up other workers' writes; 0 never rebuilds
+
+    # ISBN lookups (library_system/isbn.py)
+    ISBN_BATCH_MAX = 500  # ISBNs per batch lookup; one IN list, under SQLite's bound-parameter limit
+
+    # Server-sent events (/events on the API)
+    EVENT_HISTORY = 1000  # Recent events kept for Last-Event-ID resume
+    EVENT_CLIENT_BUFFER = 100  # Events queued per client before it is caught up from history instead
+    EVENT_HEARTBEAT = 15  # Seconds between keep-alive comments
+    EVENT_RETRY_MS = 3000  # Reconnect delay suggested to clients
+
+    # Request profiling (library_system/profiling.py); requests opt in with an
+    # X-Profile header or ?_profile=1, and get a profile report as the response
+    PROFILING = False  # Off installs nothing
+    PROFILE_TOKEN = None  # When set, the header / parameter value must match it
+    PROFILER = 'auto'  # 'cprofile', 'pyinstrument', or 'auto' (pyinstrument when installed)
+    PROFILE_DIR = None  # Also keep each report (and a .prof file for cProfile) here
+    PROFILE_TOP = 40  # Functions listed in a cProfile report
+
+    # Search
+    FULL_TEXT_SEARCH = True  # Use SQLite FTS5 indexes when available, LIKE scans otherwise
     
     # System Version
     VERSION = "1.0.0"
@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from .config import Config
+
+# In-process pub/sub for availability changes, streamed to clients as
+# server-sent events (GET /events on the API). LibrarySystem publishes after
+# each committed checkout, return or new book; publishers run on worker
+# threads (or the event loop, with the async engine) and hand events to each
+# subscriber's loop thread-safely.
+#
+# Every subscriber has a bounded buffer. One that falls behind isn't allowed
+# to grow it: it is caught up from the shared history instead, the same way
+# a reconnecting client is caught up from its Last-Event-ID. When the history
+# no longer reaches back far enough (or the id comes from another process or
+# an earlier run) the client gets a "reset" event and should re-fetch its
+# lists. Events are per process; with several API workers, pin each client
+# to one or put a broker in front.
+
+# Ids are "<run>-<sequence>", so an id from before a restart is recognised
+_RUN = f"{int(time.time()):x}{os.getpid():x}"
+
+
+def _event_id(sequence):
+    return f"{_RUN}-{sequence}"
+
+
+def _sequence(event_id):
+    run, _, sequence = (event_id or '').rpartition('-')
+    if run != _RUN or not sequence.isdigit():
+        return None
+    return int(sequence)
+
+
+class Subscriber:
+    def __init__(self, loop, size):
+        self.loop = loop
+        self.size = size
+        self.buffer = deque()
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def deliver(self, event):
+        # On the subscriber's loop
+        if len(self.buffer) >= self.size:
+            self.overflowed = True
+        else:
+            self.buffer.append(event)
+        self.ready.set()
+
+
+class EventBroker:
+    def __init__(self, history=None, client_buffer=None):
+        self.history = deque(maxlen=history or Config.EVENT_HISTORY)
+        self.client_buffer = client_buffer or Config.EVENT_CLIENT_BUFFER
+        self.subscribers = set()
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, kind, data):
+        with self._lock:
+            event = (next(self._sequence), kind, data)
+            self.history.append(event)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:
+                # Its loop has closed
+                self.unsubscribe(subscriber)
+        return _event_id(event[0])
+
+    def subscribe(self):
+        subscriber = Subscriber(asyncio.get_running_loop(), self.client_buffer)
+        with self._lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self.subscribers.discard(subscriber)
+
+    def since(self, sequence):
+        # Events after sequence, or None if some have already left the history
+        with self._lock:
+            if not self.history:
+                return []
+            if sequence < self.history[0][0] - 1:
+                return None
+            return [event for event in self.history if event[0] > sequence]
+
+    def latest(self):
+        with self._lock:
+            return self.history[-1][0] if self.history else 0
+
+    async def stream(self, last_event_id=None):
+        # Yields SSE frames until the client goes away
+        subscriber = self.subscribe()
+        # Where to start is settled before the first frame goes out, so
+        # nothing published meanwhile is skipped
+        sent = _sequence(last_event_id)
+        if sent is None:
+            sent = self.latest()
+            frames = [_frame(_event_id(sent), 'reset', {})] if last_event_id else []
+        else:
+            frames, sent = self._catch_up(sent)
+        try:
+            yield f"retry: {Config.EVENT_RETRY_MS}\n\n"
+            for frame in frames:
+                yield frame
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), Config.EVENT_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                subscriber.ready.clear()
+                if subscriber.overflowed:
+                    subscriber.buffer.clear()
+                    subscriber.overflowed = False
+                    frames, sent = self._catch_up(sent)
+                    for frame in frames:
+                        yield frame
+                    continue
+                while subscriber.buffer:
+                    sequence, kind, data = subscriber.buffer.popleft()
+                    if sequence > sent:
+                        sent = sequence
+                        yield _frame(_event_id(sequence), kind, data)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _catch_up(self, sent):
+        missed = self.since(sent)
+        if missed is None:
+            latest = self.latest()
+            return [_frame(_event_id(latest), 'reset', {})], latest
+        frames = [_frame(_event_id(sequence), kind, data) for sequence, kind, data in missed]
+        return frames, missed[-1][0] if missed else sent
+
+
+def _frame(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+broker = EventBroker()
+
+
+def book_changed(book):
+    broker.publish('book', {'id': book.id, 'quantity': book.quantity})
+
+
+def loan_changed(transaction):
+    broker.publish('loan', {'id': transaction.id, 'book_id': transaction.book_id,
+                            'user_id': transaction.user_id, 'status': transaction.status})
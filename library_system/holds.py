@@ -0,0 +1,163 @@
+import argparse
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from .config import Config
+from .circulation import RecordNotFound, count_loan
+from . import stats
+
+# Hold queues. A patron who finds no copy on the shelf joins the book's FIFO
+# queue instead of retrying the checkout, and every returned copy goes
+# straight to the head of that queue, in the same transaction as the return.
+# Only live holds are stored (a hold is deleted once it is collected,
+# cancelled or lapses), so a queue's head is at the front of the
+# (book_id, position) index however long the table's history. A "Ready" hold
+# has a copy set aside for it, already off the shelf count, until its
+# expires_at; the sweep passes uncollected copies on. As in circulation.py,
+# the model classes are passed in.
+
+WAITING = "Waiting"
+READY = "Ready"
+
+
+def _head(session, Hold, book_id):
+    return session.query(Hold).filter(
+        Hold.book_id == book_id,
+        Hold.status == WAITING
+    ).order_by(Hold.position, Hold.id).first()
+
+
+def place_hold(session, Hold, Book, User, book_id, user_id, today=None):
+    # Joins the queue; only for books with no copy free to borrow. Does not commit
+    today = today or datetime.utcnow().date()
+    book = session.get(Book, book_id)
+    if book is None or session.get(User, user_id) is None:
+        raise RecordNotFound("Book or user not found")
+    if book.quantity > 0 and _head(session, Hold, book_id) is None:
+        raise ValueError("Book is available")
+    if session.query(Hold.id).filter(Hold.user_id == user_id, Hold.book_id == book_id).first():
+        raise ValueError("User already has a hold on this book")
+
+    last = session.query(func.max(Hold.position)).filter(Hold.book_id == book_id).scalar()
+    hold = Hold(book_id=book_id, user_id=user_id, position=(last or 0) + 1,
+                status=WAITING, placed_at=today)
+    session.add(hold)
+    session.flush()
+    return hold
+
+
+def queue_ahead(session, Hold, hold):
+    # Holds still waiting in front of this one
+    if hold.status == READY:
+        return 0
+    return session.query(func.count(Hold.id)).filter(
+        Hold.book_id == hold.book_id,
+        Hold.status == WAITING,
+        Hold.position < hold.position
+    ).scalar()
+
+
+def assign_copy(session, Hold, Book, Stat, book_id, today=None):
+    # Moves one shelf copy of the book to the head of its queue. Returns the
+    # id of the hold now ready for collection, or None
+    head = _head(session, Hold, book_id)
+    if head is None:
+        return None
+    taken = session.query(Book).filter(
+        Book.id == book_id,
+        Book.quantity > 0
+    ).update({Book.quantity: Book.quantity - 1}, synchronize_session=False)
+    if not taken:
+        return None
+    today = today or datetime.utcnow().date()
+    session.query(Hold).filter(Hold.id == head.id, Hold.status == WAITING).update(
+        {Hold.status: READY, Hold.expires_at: today + timedelta(days=Config.HOLD_PICKUP_DAYS)},
+        synchronize_session=False)
+    if Stat is not None:
+        stats.bump(session, Stat, copies=-1)
+    return head.id
+
+
+def claim_hold(session, Hold, User, book_id, user_id, max_loans=None):
+    # Checkout path: a ready hold hands over its set-aside copy. Returns False
+    # when the borrower has none, and the copy must come off the shelf
+    claimed = session.query(Hold).filter(
+        Hold.book_id == book_id,
+        Hold.user_id == user_id,
+        Hold.status == READY
+    ).delete(synchronize_session=False)
+    if not claimed:
+        # A shelf copy ends the borrower's wait too
+        session.query(Hold).filter(Hold.book_id == book_id, Hold.user_id == user_id).delete(
+            synchronize_session=False)
+        return False
+    count_loan(session, User, user_id, max_loans)
+    return True
+
+
+def _release_set_aside(session, Hold, Book, Stat, book_id, today):
+    # An uncollected copy goes to the next in line, or back on the shelf
+    session.query(Book).filter(Book.id == book_id).update(
+        {Book.quantity: Book.quantity + 1}, synchronize_session=False)
+    if Stat is not None:
+        stats.bump(session, Stat, copies=1)
+    assign_copy(session, Hold, Book, Stat, book_id, today)
+
+
+def cancel_hold(session, Hold, Book, Stat, hold_id, today=None):
+    # Returns the book id. Does not commit
+    hold = session.get(Hold, hold_id)
+    if hold is None:
+        raise RecordNotFound("Hold not found")
+    book_id, status = hold.book_id, hold.status
+    session.query(Hold).filter(Hold.id == hold_id).delete(synchronize_session=False)
+    if status == READY:
+        _release_set_aside(session, Hold, Book, Stat, book_id, today or datetime.utcnow().date())
+    return book_id
+
+
+def expire_holds(session, Hold, Book, Stat=None, on_date=None):
+    # Lapses ready holds past their pickup date and passes their copies on.
+    # Also serves waiting queues from copies that reached the shelf some other
+    # way (quantity edits, imports). Returns the ids of books whose shelf count
+    # changed. Does not commit
+    on_date = on_date or datetime.utcnow().date()
+    changed = set()
+    expired = session.query(Hold.id, Hold.book_id).filter(
+        Hold.status == READY,
+        Hold.expires_at < on_date
+    ).all()
+    for hold_id, book_id in expired:
+        session.query(Hold).filter(Hold.id == hold_id).delete(synchronize_session=False)
+        _release_set_aside(session, Hold, Book, Stat, book_id, on_date)
+        changed.add(book_id)
+
+    stranded = session.query(Hold.book_id).join(Book, Book.id == Hold.book_id).filter(
+        Hold.status == WAITING,
+        Book.quantity > 0
+    ).distinct().all()
+    for book_id, in stranded:
+        while assign_copy(session, Hold, Book, Stat, book_id, on_date) is not None:
+            changed.add(book_id)
+    return changed
+
+
+def main(argv=None):
+    from .models import startup_schema_check
+    from .operations import LibrarySystem
+
+    parser = argparse.ArgumentParser(description="Lapse uncollected holds and pass their copies on")
+    parser.parse_args(argv)
+
+    startup_schema_check()
+    library = LibrarySystem()
+    try:
+        changed = library.expire_holds()
+    finally:
+        library.close()
+    print(f"{len(changed)} books had held copies passed on")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
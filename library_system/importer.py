@@ -0,0 +1,202 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from itertools import islice
+from sqlalchemy.exc import SQLAlchemyError
+from .config import Config
+from .isbn import canonical_isbn
+
+# Streaming CSV/JSONL import. Rows are parsed and validated one at a time,
+# then written in executemany batches, one transaction per batch, as upserts
+# keyed on canonical ISBN (books, so any ISBN-10/13 form of a book updates the
+# same row) or email (users). A bad row is reported with its line number and
+# never aborts the rest of the file.
+
+FORMATS = ('csv', 'jsonl')
+
+
+def _text(row, field, required=True):
+    value = row.get(field)
+    if value is None or str(value).strip() == '':
+        if required:
+            raise ValueError(f"Missing field: {field}")
+        return None
+    return str(value).strip()
+
+
+def clean_book(row, domain=None):
+    try:
+        quantity = int(_text(row, 'quantity'))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid quantity: {row.get('quantity')!r}")
+    if quantity < 0:
+        raise ValueError("quantity must not be negative")
+    isbn = _text(row, 'isbn')
+    return {
+        'title': _text(row, 'title'),
+        'author': _text(row, 'author'),
+        'genre': _text(row, 'genre', required=False),
+        'isbn': isbn,
+        'isbn13': canonical_isbn(isbn),
+        'quantity': quantity,
+    }
+
+
+def clean_user(row, domain=None):
+    email = _text(row, 'email')
+    if '@' not in email and domain:
+        email = f"{email}@{domain}"
+    return {
+        'name': _text(row, 'name'),
+        'email': email,
+        'student_id': _text(row, 'student_id', required=False),
+        'membership_type': _text(row, 'membership_type'),
+        'join_date': datetime.utcnow().date(),
+        'books_loaned': 0,
+    }
+
+
+# kind -> (validator, conflict key, columns refreshed on conflict)
+IMPORTERS = {
+    'books': (clean_book, 'isbn13', ('title', 'author', 'genre', 'quantity')),
+    'users': (clean_user, 'email', ('name', 'student_id', 'membership_type')),
+}
+
+
+def upsert_statement(table, key, update_columns, dialect_name):
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect_name}")
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[key],
+        set_={column: statement.excluded[column] for column in update_columns}
+    )
+
+
+def read_records(stream, fmt):
+    # Yields (line number, raw row) pairs, or (line number, ValueError) for
+    # lines that can't be parsed. Accepts text or binary file objects
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                row = ValueError("Each line must be a JSON object")
+            yield line_number, row
+    else:
+        raise ValueError(f"Unsupported format: {fmt} (expected one of {', '.join(FORMATS)})")
+
+
+class ImportReport:
+    def __init__(self):
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < Config.IMPORT_MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def _write_batch(session, statement, batch, report):
+    try:
+        session.execute(statement, [values for _, values in batch])
+        session.commit()
+        report.imported += len(batch)
+        return
+    except SQLAlchemyError:
+        session.rollback()
+
+    # Something in the batch violated a constraint; replay it row by row to
+    # find out which lines failed and keep the rest
+    for line, values in batch:
+        try:
+            session.execute(statement, [values])
+            session.commit()
+            report.imported += 1
+        except SQLAlchemyError as e:
+            session.rollback()
+            report.error(line, str(getattr(e, 'orig', e)))
+
+
+def import_records(session, table, kind, stream, fmt, domain=None, batch_size=None):
+    validate, key, update_columns = IMPORTERS[kind]
+    statement = upsert_statement(table, key, update_columns, session.get_bind().dialect.name)
+    batch_size = batch_size or Config.IMPORT_BATCH_SIZE
+    report = ImportReport()
+
+    def valid_rows():
+        for line, row in read_records(stream, fmt):
+            report.processed += 1
+            if isinstance(row, ValueError):
+                report.error(line, str(row))
+                continue
+            try:
+                yield line, validate(row, domain)
+            except ValueError as e:
+                report.error(line, str(e))
+
+    rows = valid_rows()
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        _write_batch(session, statement, batch, report)
+    return report.as_dict()
+
+
+def main(argv=None):
+    from .models import startup_schema_check
+    from .operations import LibrarySystem
+
+    parser = argparse.ArgumentParser(description="Bulk import books or users from CSV/JSONL")
+    parser.add_argument('kind', choices=sorted(IMPORTERS))
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=FORMATS,
+                        help="Defaults to the file extension")
+    parser.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    startup_schema_check()
+    library = LibrarySystem()
+    try:
+        with open(args.path, 'rb') as stream:
+            report = library.import_records(args.kind, stream, fmt, args.batch_size)
+    finally:
+        library.close()
+    print(json.dumps(report, indent=2))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
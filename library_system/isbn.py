@@ -0,0 +1,96 @@
+import logging
+import re
+from sqlalchemy import inspect, text
+from .config import Config
+
+# Canonical ISBNs. Books keep the ISBN as entered (hyphenated, spaced, ISBN-10
+# or ISBN-13) in isbn, and its 13-digit form in isbn13, which carries a unique
+# index. Lookups canonicalise whatever form they are given and match on
+# isbn13, so "0-306-40615-2", "0306406152" and "978-0-306-40615-7" all find
+# the same book with one index probe.
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = re.compile(r"^ISBN(?:-1[03])?:?", re.IGNORECASE)
+_SEPARATORS = re.compile(r"[\s-]")
+
+
+def check_digit(first12):
+    # ISBN-13 check digit for 12 leading digits
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def canonical_isbn(value):
+    # The 13-digit form of an ISBN-10 or ISBN-13. Raises ValueError if it
+    # isn't one, or its check digit is wrong
+    digits = _SEPARATORS.sub('', _PREFIX.sub('', str(value or '').strip())).upper()
+    if len(digits) == 10 and digits[:9].isdigit() and (digits[9].isdigit() or digits[9] == 'X'):
+        total = sum((10 - i) * int(d) for i, d in enumerate(digits[:9]))
+        total += 10 if digits[9] == 'X' else int(digits[9])
+        if total % 11:
+            raise ValueError(f"Invalid ISBN check digit: {value!r}")
+        first12 = '978' + digits[:9]
+        return first12 + check_digit(first12)
+    if len(digits) == 13 and digits.isdigit() and digits[:3] in ('978', '979'):
+        if digits[12] != check_digit(digits[:12]):
+            raise ValueError(f"Invalid ISBN check digit: {value!r}")
+        return digits
+    raise ValueError(f"Invalid ISBN: {value!r}")
+
+
+def canonical_isbns(values):
+    # {value: isbn13 or None} for a batch of lookups, in request order
+    if len(values) > Config.ISBN_BATCH_MAX:
+        raise ValueError(f"At most {Config.ISBN_BATCH_MAX} ISBNs per request")
+    canonical = {}
+    for value in values:
+        try:
+            canonical[value] = canonical_isbn(value)
+        except ValueError:
+            canonical[value] = None
+    return canonical
+
+
+def backfill_isbn13(table, index_name, batch_size=None):
+    # Migration operation: adds the isbn13 column (unless create_all already
+    # did), fills it in from isbn in id-ordered batches, then builds the
+    # unique index. Rows whose ISBN doesn't parse, or that name the same book
+    # as a lower id, are left NULL and logged for someone to fix by hand
+    batch_size = batch_size or Config.IMPORT_BATCH_SIZE
+
+    def operation(conn):
+        if 'isbn13' not in {column['name'] for column in inspect(conn).get_columns(table)}:
+            conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN isbn13 VARCHAR(13)')
+        seen = {row[0] for row in conn.exec_driver_sql(
+            f'SELECT isbn13 FROM "{table}" WHERE isbn13 IS NOT NULL')}
+        select = text(f'SELECT id, isbn FROM "{table}" WHERE isbn13 IS NULL AND id > :after '
+                      'ORDER BY id LIMIT :limit')
+        update = text(f'UPDATE "{table}" SET isbn13 = :isbn13 WHERE id = :id')
+        after, skipped = 0, []
+        while True:
+            rows = conn.execute(select, {'after': after, 'limit': batch_size}).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, isbn in rows:
+                try:
+                    isbn13 = canonical_isbn(isbn)
+                except ValueError:
+                    skipped.append(row_id)
+                    continue
+                if isbn13 in seen:
+                    skipped.append(row_id)
+                    continue
+                seen.add(isbn13)
+                updates.append({'id': row_id, 'isbn13': isbn13})
+            if updates:
+                conn.execute(update, updates)
+            after = rows[-1][0]
+        conn.exec_driver_sql(f'CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON "{table}" (isbn13)')
+        if skipped:
+            logger.warning("%d %s rows have an invalid or duplicate ISBN and no isbn13 (ids %s%s)",
+                           len(skipped), table, ', '.join(map(str, skipped[:20])),
+                           ', ...' if len(skipped) > 20 else '')
+
+    return operation
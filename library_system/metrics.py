@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+from .config import Config
+
+# In-process metrics in the Prometheus text format. Request hooks (the ASGI
+# middleware below for the API, before/after_request in app.py) time every
+# request by route; SQLAlchemy cursor events time every statement and charge
+# it to the request that ran it, found through a context variable so it
+# follows the request onto the worker thread pool. Scrape /metrics on either
+# app. Statements slower than Config.SLOW_QUERY_THRESHOLD are also logged.
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [f"{self.name}{_labels(self.labels, key)} {value}"
+                    for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                # per-bucket counts (not cumulative), then sum and count
+                series = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Gauge:
+    # Read when scraped
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._sources = {}
+
+    def track(self, read, *label_values):
+        self._sources[label_values] = read
+
+    def samples(self):
+        return [f"{self.name}{_labels(self.labels, key)} {read()}"
+                for key, read in sorted(self._sources.items())]
+
+
+REQUEST_SECONDS = Histogram(
+    'library_http_request_duration_seconds', "Request latency by route",
+    ('app', 'method', 'route', 'status'))
+REQUEST_QUERIES = Histogram(
+    'library_http_request_queries', "SQL statements run per request",
+    ('app', 'route'), COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram(
+    'library_http_request_db_seconds', "Time spent in SQL per request",
+    ('app', 'route'))
+QUERY_SECONDS = Histogram(
+    'library_db_query_duration_seconds', "SQL statement latency by statement type",
+    ('engine', 'statement'))
+SLOW_QUERIES = Counter(
+    'library_db_slow_queries_total', "Statements slower than the slow-query threshold",
+    ('engine', 'statement'))
+POOL_CHECKOUT_SECONDS = Histogram(
+    'library_db_pool_checkout_seconds', "Time to get a connection from the pool (including connecting)",
+    ('engine',))
+POOL_CONNECTIONS = Gauge(
+    'library_db_pool_checked_out', "Connections currently checked out of the pool",
+    ('engine',))
+
+REGISTRY = [REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, QUERY_SECONDS,
+            SLOW_QUERIES, POOL_CHECKOUT_SECONDS, POOL_CONNECTIONS]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current = ContextVar('library_request_stats', default=None)
+
+
+def start_request():
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def finish_request(stats, app, method, route, status, seconds):
+    REQUEST_SECONDS.observe(seconds, app, method, route, str(status))
+    REQUEST_QUERIES.observe(stats.queries, app, route)
+    REQUEST_DB_SECONDS.observe(stats.db_seconds, app, route)
+
+
+def _statement_type(statement):
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return verb if verb in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'PRAGMA') else 'OTHER'
+
+
+_instrumented = set()
+
+
+def instrument_engine(engine, name='default'):
+    # Idempotent; takes sync or async engines
+    engine = getattr(engine, 'sync_engine', engine)
+    if not Config.METRICS or id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['query_started']
+        kind = _statement_type(statement)
+        QUERY_SECONDS.observe(seconds, name, kind)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+        if seconds >= Config.SLOW_QUERY_THRESHOLD:
+            SLOW_QUERIES.inc(name, kind)
+            logger.warning("Slow query (%.3fs): %s", seconds, " ".join(statement.split())[:500])
+
+    # Pools have no "checkout started" event, so time the engine's own
+    # call into the pool
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, name)
+
+    engine.raw_connection = timed_raw_connection
+    if hasattr(engine.pool, 'checkedout'):
+        # Looked up at scrape time, as dispose() replaces the pool
+        POOL_CONNECTIONS.track(lambda: engine.pool.checkedout(), name)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware, so streamed responses are timed to their last chunk
+    def __init__(self, app, name='api'):
+        self.app = app
+        self.name = name
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not Config.METRICS:
+            await self.app(scope, receive, send)
+            return
+
+        stats = start_request()
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            finish_request(stats, self.name, scope['method'],
+                           getattr(route, 'path', 'unmatched'), status,
+                           time.perf_counter() - started)
@@ -0,0 +1,150 @@
+import argparse
+import sys
+from datetime import datetime
+from sqlalchemy import text
+from .isbn import backfill_isbn13
+
+# Versioned schema migrations. create_all only creates missing tables, so any
+# change to an existing table (new indexes, columns, backfills) goes here as
+# the next numbered step. Each step runs once, in its own transaction, and is
+# recorded in schema_version, so migrate() is safe to call on every startup.
+#
+# A step is (version, name, operations) where each operation is either a SQL
+# string or a callable taking the connection.
+#
+# The API's models and the Flask app (app.py) keep the same schema under
+# different table names, so the steps are built from a table map rather than
+# written out once per app.
+
+API_TABLES = {'book': 'books', 'user': 'users', 'transaction': 'transactions', 'stat': 'library_stats'}
+FLASK_TABLES = {'book': 'book', 'user': 'user', 'transaction': 'transaction', 'stat': 'stat'}
+
+
+def schema_migrations(tables, listing_indexes=False):
+    # listing_indexes: the sort columns of the Flask app's HTML listing pages
+    book, user, loan, stat = (tables[name] for name in ('book', 'user', 'transaction', 'stat'))
+    steps = [
+        (1, 'transaction_indexes', [
+            f'CREATE INDEX IF NOT EXISTS ix_{loan}_status_due_date ON "{loan}" (status, due_date)',
+            f'CREATE INDEX IF NOT EXISTS ix_{loan}_user_id_borrow_date ON "{loan}" (user_id, borrow_date)',
+            f'CREATE INDEX IF NOT EXISTS ix_{loan}_book_id_borrow_date ON "{loan}" (book_id, borrow_date)',
+        ]),
+        (2, 'seed_table_versions', [
+            f'INSERT OR IGNORE INTO "{stat}" (name, value) VALUES '
+            "('books_version', 1), ('users_version', 1), ('transactions_version', 1)",
+        ]),
+        (3, 'book_isbn13', [
+            backfill_isbn13(book, f'ix_{book}_isbn13'),
+        ]),
+    ]
+    if listing_indexes:
+        steps.append((4, 'listing_sort_indexes', [
+            f'CREATE INDEX IF NOT EXISTS ix_{book}_title ON "{book}" (title)',
+            f'CREATE INDEX IF NOT EXISTS ix_{book}_author ON "{book}" (author)',
+            f'CREATE INDEX IF NOT EXISTS ix_{user}_name ON "{user}" (name)',
+            f'CREATE INDEX IF NOT EXISTS ix_{loan}_borrow_date ON "{loan}" (borrow_date)',
+            f'CREATE INDEX IF NOT EXISTS ix_{loan}_due_date ON "{loan}" (due_date)',
+        ]))
+    return steps
+
+
+def hot_queries(tables):
+    # The filters and sort orders behind get_overdue_books, get_user_history
+    # and get_book_history. Each must be answered from an index rather than
+    # a scan of the loan table. The id tie-break comes free: SQLite appends
+    # the rowid to every index
+    loan = tables['transaction']
+    return {
+        'overdue_loans': (
+            f"SELECT * FROM \"{loan}\" WHERE status IN ('Borrowed', 'Overdue') AND due_date < :today",
+            {'today': '2000-01-01'}
+        ),
+        'user_history': (
+            f'SELECT * FROM "{loan}" WHERE user_id = :user_id ORDER BY borrow_date DESC, id DESC',
+            {'user_id': 1}
+        ),
+        'book_history': (
+            f'SELECT * FROM "{loan}" WHERE book_id = :book_id ORDER BY borrow_date DESC, id DESC',
+            {'book_id': 1}
+        ),
+    }
+
+
+MIGRATIONS = schema_migrations(API_TABLES)
+HOT_QUERIES = hot_queries(API_TABLES)
+
+
+def _ensure_version_table(conn, table):
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {table} ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at VARCHAR(32) NOT NULL)"
+    )
+
+
+def applied_versions(engine, table='schema_version'):
+    with engine.begin() as conn:
+        _ensure_version_table(conn, table)
+        return {row[0] for row in conn.exec_driver_sql(f"SELECT version FROM {table}")}
+
+
+def migrate(engine, migrations=MIGRATIONS, table='schema_version'):
+    # Applies pending steps in order and returns the names of those it ran
+    done = applied_versions(engine, table)
+    ran = []
+    for version, name, operations in sorted(migrations, key=lambda step: step[0]):
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            for operation in operations:
+                if callable(operation):
+                    operation(conn)
+                else:
+                    conn.exec_driver_sql(operation)
+            conn.execute(
+                text(f"INSERT INTO {table} (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {'version': version, 'name': name, 'applied_at': datetime.utcnow().isoformat()}
+            )
+        ran.append(name)
+    return ran
+
+
+def query_plan(engine, sql, params):
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)]
+
+
+def check_query_plans(engine, queries=HOT_QUERIES, table='transactions'):
+    # Returns {name: (uses_index, plan)}. A query fails if SQLite has to scan
+    # the table or build a temporary B-tree to sort it
+    results = {}
+    for name, (sql, params) in queries.items():
+        plan = query_plan(engine, sql, params)
+        scans = any(step.startswith(f"SCAN {table}") or 'TEMP B-TREE' in step for step in plan)
+        results[name] = (not scans, plan)
+    return results
+
+
+def main(argv=None):
+    from .models import get_engine, ensure_schema
+
+    parser = argparse.ArgumentParser(description="Create missing tables and apply pending schema migrations")
+    parser.add_argument('--check', action='store_true',
+                        help="Also verify that the hot queries are served by an index")
+    args = parser.parse_args(argv)
+
+    # The deploy-time schema step; see Config.SCHEMA_CHECK
+    engine = get_engine()
+    ran = ensure_schema(engine)
+    print(f"Applied: {', '.join(ran)}" if ran else "Schema is up to date")
+    if not args.check:
+        return 0
+
+    failed = False
+    for name, (uses_index, plan) in check_query_plans(engine).items():
+        failed = failed or not uses_index
+        print(f"{'ok  ' if uses_index else 'FAIL'} {name}: {'; '.join(plan)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,33 @@
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, ForeignKey
+import threading
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.pool import QueuePool
 from .config import Config
+from .search import install_fts
+from .penalties import penalty_for
+from .migrations import migrate
+from .pragmas import install_pragmas
+from .metrics import instrument_engine
+from .archive import archive_schema, attach_archive
 
 Base = declarative_base()
 
 class Book(Base):
     __tablename__ = 'books'
+    # isbn as entered, isbn13 its canonical form (library_system/isbn.py).
+    # The index is also built by migrations.MIGRATIONS
+    __table_args__ = (
+        Index('ix_books_isbn13', 'isbn13', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String(255), nullable=False)
     author = Column(String(255), nullable=False)
     genre = Column(String(100))
     isbn = Column(String(20), unique=True, nullable=False)
+    isbn13 = Column(String(13))
     quantity = Column(Integer, default=0)
     transactions = relationship('Transaction', back_populates='book')
 
@@ -37,6 +51,12 @@ class User(Base):
 
 class Transaction(Base):
     __tablename__ = 'transactions'
+    # Kept in step with migrations.MIGRATIONS, which adds them to existing databases
+    __table_args__ = (
+        Index('ix_transactions_status_due_date', 'status', 'due_date'),
+        Index('ix_transactions_user_id_borrow_date', 'user_id', 'borrow_date'),
+        Index('ix_transactions_book_id_borrow_date', 'book_id', 'borrow_date'),
+    )
     
     id = Column(Integer, primary_key=True)
     book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
@@ -53,15 +73,118 @@ class Transaction(Base):
     def calculate_penalty(self):
         if self.status == "Returned" or self.status == "Borrowed":
             return 0.00
-        
-        today = datetime.utcnow().date()
-        days_overdue = (today - self.due_date).days
-        if days_overdue <= 0:
-            return 0.00
-            
-        return min(days_overdue * Config.PENALTY_RATE, Config.MAX_PENALTY)
+        return penalty_for(self.due_date)
+
+class ArchivedTransaction(Base):
+    # Returned loans moved out of transactions by library_system/archive.py.
+    # No foreign keys, as the table may live in another (attached) file
+    __tablename__ = 'transactions_archive'
+    __table_args__ = (
+        Index('ix_transactions_archive_user_id_borrow_date', 'user_id', 'borrow_date'),
+        Index('ix_transactions_archive_book_id_borrow_date', 'book_id', 'borrow_date'),
+        archive_schema(),
+    )
+
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    borrow_date = Column(Date, nullable=False)
+    due_date = Column(Date, nullable=False)
+    return_date = Column(Date)
+    status = Column(String(50), nullable=False)
+    penalty_fee = Column(Float, default=0.00)
+    archived_at = Column(Date, nullable=False)
+
+    book = relationship('Book', primaryjoin='foreign(ArchivedTransaction.book_id) == Book.id', viewonly=True)
+    user = relationship('User', primaryjoin='foreign(ArchivedTransaction.user_id) == User.id', viewonly=True)
+
+class Hold(Base):
+    __tablename__ = 'holds'
+    # Live holds only (see library_system/holds.py); a book's queue is read
+    # in position order off the first index
+    __table_args__ = (
+        Index('ix_holds_book_id_position', 'book_id', 'position'),
+        Index('ix_holds_user_id_book_id', 'user_id', 'book_id', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    position = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False)
+    placed_at = Column(Date, nullable=False, default=datetime.utcnow)
+    expires_at = Column(Date)
+
+class Stat(Base):
+    __tablename__ = 'library_stats'
+
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
 
 # Database setup
-engine = create_engine(Config.DATABASE_URL)
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+def engine_options(url, is_async=False):
+    options = {
+        'pool_size': Config.POOL_SIZE,
+        'max_overflow': Config.MAX_OVERFLOW,
+        'pool_timeout': Config.POOL_TIMEOUT,
+        'pool_recycle': Config.POOL_RECYCLE,
+        'pool_pre_ping': Config.POOL_PRE_PING,
+    }
+    if not is_async:
+        # SQLite file databases otherwise default to NullPool on older SQLAlchemy
+        options['poolclass'] = QueuePool
+        if url.startswith('sqlite'):
+            # Pooled connections move between the API's worker threads
+            options['connect_args'] = {'check_same_thread': False}
+    return options
+
+# Nothing here touches the database at import: the engine is built on first
+# use, and the schema is checked by ensure_schema(), which the API runs once
+# at startup (see library_system/api.py) or a deploy step runs on its own
+_engine = None
+_schema_checked = False
+_lock = threading.Lock()
+
+# Sessions are per request, so loaded objects stay readable after commit.
+# Bound to the engine by get_engine()
+Session = sessionmaker(expire_on_commit=False)
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                engine = create_engine(Config.DATABASE_URL, **engine_options(Config.DATABASE_URL))
+                attach_archive(engine)
+                install_pragmas(engine)
+                instrument_engine(engine, 'api')
+                Session.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+def get_session():
+    return Session(bind=get_engine())
+
+def dispose_engine():
+    if _engine is not None:
+        _engine.dispose()
+
+def ensure_schema(engine=None):
+    # Creates missing tables, applies pending migrations and sets up search.
+    # Runs once per process; returns the migrations it applied
+    global _schema_checked
+    engine = engine or get_engine()
+    with _lock:
+        if _schema_checked and engine is _engine:
+            return []
+        Base.metadata.create_all(engine)
+        ran = migrate(engine)
+        install_fts(engine)
+        if engine is _engine:
+            _schema_checked = True
+    return ran
+
+def startup_schema_check():
+    # What the API does at startup, for the maintenance CLIs: nothing when
+    # deploys run the migrations themselves (Config.SCHEMA_CHECK off)
+    return ensure_schema() if Config.SCHEMA_CHECK else []
@@ -1,134 +1,298 @@
 from datetime import datetime, timedelta
-from .models import Session, Book, User, Transaction
+from sqlalchemy.orm import joinedload
+from .models import get_session, Book, User, Transaction, ArchivedTransaction, Stat, Hold
 from .config import Config
+from .pagination import keyset_page
+from .search import fts_enabled, search_fts
+from .circulation import run_atomically, reserve_copy, release_copy, OPEN_STATUSES
+from .importer import import_records
+from . import stats
+from . import holds
+from . import events
+from . import archive
+from . import autocomplete
+from .cache import load_record, invalidate, invalidate_all, sync_versions
+from .penalties import accrue_overdue, penalty_for
+from .etags import touch, read_versions, make_etag
+from .serializers import hold_to_dict
+from .isbn import canonical_isbn, canonical_isbns
 
 class LibrarySystem:
-    def __init__(self):
-        self.session = Session()
+    def __init__(self, session=None, writer=None):
+        self.session = session or get_session()
+        # Group-commit writer for request writes (library_system/writer.py)
+        self.writer = writer
         self.library_name = Config.LIBRARY_NAME
         self.domain = Config.DOMAIN_NAME
 
+    @property
+    def full_text(self):
+        # Probed once per database, on the first search
+        return fts_enabled(self.session.get_bind())
+
+    def _write(self, work):
+        # Runs work(session) and commits it, in the writer's next batch when
+        # there is a writer. Cache, index and event updates follow the return
+        if self.writer is not None:
+            return self.writer.run(work)
+        return run_atomically(self.session, lambda: work(self.session))
+
     def add_book(self, title, author, genre, isbn, quantity):
-        try:
+        isbn13 = canonical_isbn(isbn)
+
+        def insert(session):
             book = Book(
                 title=title,
                 author=author,
                 genre=genre,
                 isbn=isbn,
+                isbn13=isbn13,
                 quantity=quantity
             )
-            self.session.add(book)
-            self.session.commit()
+            session.add(book)
+            stats.bump(session, Stat, books=1, copies=quantity)
+            touch(session, Stat, 'books')
             return book
-        except Exception as e:
-            self.session.rollback()
-            raise e
+
+        book = self._write(insert)
+        events.book_changed(book)
+        autocomplete.index.add_book(book.id, book.title, book.author)
+        return book
 
     def add_user(self, name, email, student_id, membership_type):
-        try:
-            # Format email with domain if not provided
-            if '@' not in email:
-                email = f"{email}@{self.domain}"
-                
+        # Format email with domain if not provided
+        if '@' not in email:
+            email = f"{email}@{self.domain}"
+
+        def insert(session):
             user = User(
                 name=name,
                 email=email,
                 student_id=student_id,
                 membership_type=membership_type,
-                join_date=datetime.utcnow()
+                join_date=datetime.utcnow().date()
             )
-            self.session.add(user)
-            self.session.commit()
+            session.add(user)
+            stats.bump(session, Stat, users=1)
+            touch(session, Stat, 'users')
             return user
-        except Exception as e:
-            self.session.rollback()
-            raise e
 
-    def borrow_book(self, book_id, user_id):
-        try:
-            book = self.session.query(Book).get(book_id)
-            user = self.session.query(User).get(user_id)
-
-            if not book or not user:
-                raise ValueError("Book or user not found")
-
-            if book.quantity <= 0:
-                raise ValueError("Book not available")
-
-            if user.books_loaned >= Config.MAX_BOOKS_PER_USER:
-                raise ValueError(f"User has reached maximum number of books allowed ({Config.MAX_BOOKS_PER_USER})")
+        user = self._write(insert)
+        autocomplete.index.add_user(user.id, user.name)
+        return user
 
+    def borrow_book(self, book_id, user_id):
+        def checkout(session):
+            claimed = holds.claim_hold(session, Hold, User, book_id, user_id, Config.MAX_BOOKS_PER_USER)
+            if not claimed:
+                reserve_copy(session, Book, User, book_id, user_id, Config.MAX_BOOKS_PER_USER)
             transaction = Transaction(
                 book_id=book_id,
                 user_id=user_id,
-                borrow_date=datetime.utcnow(),
-                due_date=datetime.utcnow() + timedelta(days=Config.LOAN_PERIOD_DAYS),
+                borrow_date=datetime.utcnow().date(),
+                due_date=datetime.utcnow().date() + timedelta(days=Config.LOAN_PERIOD_DAYS),
                 status="Borrowed"
             )
+            session.add(transaction)
+            # A held copy was already taken off the shelf count
+            stats.bump(session, Stat, copies=0 if claimed else -1, active_loans=1)
+            touch(session, Stat, 'books', 'users', 'transactions')
+            return transaction
 
-            book.quantity -= 1
-            user.books_loaned += 1
+        transaction = self._write(checkout)
+        invalidate(Book, book_id)
+        invalidate(User, user_id)
+        return self._loan_changed(transaction.id)
 
-            self.session.add(transaction)
-            self.session.commit()
+    def return_book(self, transaction_id):
+        def checkin(session):
+            transaction, previous_status = release_copy(session, Book, User, Transaction,
+                                                        transaction_id, datetime.utcnow())
+            stats.loan_closed(session, Stat, previous_status)
+            holds.assign_copy(session, Hold, Book, Stat, transaction.book_id)
+            touch(session, Stat, 'books', 'users', 'transactions')
+            transaction.penalty_fee = penalty_for(transaction.due_date, transaction.return_date)
             return transaction
-        except Exception as e:
-            self.session.rollback()
-            raise e
 
-    def return_book(self, transaction_id):
-        try:
-            transaction = self.session.query(Transaction).get(transaction_id)
-            if not transaction:
-                raise ValueError("Transaction not found")
+        transaction = self._write(checkin)
+        invalidate(Book, transaction.book_id)
+        invalidate(User, transaction.user_id)
+        return self._loan_changed(transaction.id)
 
-            if transaction.status == "Returned":
-                raise ValueError("Book already returned")
+    def _loan_changed(self, transaction_id):
+        # Reloads the committed loan (with its book's new shelf count) and
+        # tells event stream subscribers
+        transaction = self._transaction_with_details(transaction_id)
+        events.loan_changed(transaction)
+        events.book_changed(transaction.book)
+        return transaction
 
-            transaction.return_date = datetime.utcnow()
-            transaction.status = "Returned"
-            transaction.penalty_fee = transaction.calculate_penalty()
+    def _books_changed(self, book_ids):
+        if book_ids:
+            for book in self.session.query(Book).populate_existing().filter(Book.id.in_(book_ids)):
+                events.book_changed(book)
 
-            transaction.book.quantity += 1
-            transaction.user.books_loaned -= 1
+    def _hold_with_queue(self, hold):
+        return dict(hold_to_dict(hold), ahead=holds.queue_ahead(self.session, Hold, hold))
 
-            self.session.commit()
-            return transaction
-        except Exception as e:
-            self.session.rollback()
-            raise e
+    def place_hold(self, book_id, user_id):
+        hold = self._write(lambda session: holds.place_hold(session, Hold, Book, User, book_id, user_id))
+        return self._hold_with_queue(hold)
+
+    def get_hold(self, hold_id):
+        hold = self.session.get(Hold, hold_id)
+        return self._hold_with_queue(hold) if hold else None
+
+    def get_book_holds(self, book_id):
+        # The queue in order; one indexed range read
+        queue, ahead = [], 0
+        for hold in self.session.query(Hold).filter(Hold.book_id == book_id).order_by(Hold.position, Hold.id):
+            queue.append(dict(hold_to_dict(hold), ahead=0 if hold.status == holds.READY else ahead))
+            ahead += hold.status == holds.WAITING
+        return queue
+
+    def cancel_hold(self, hold_id):
+        def cancel(session):
+            book_id = holds.cancel_hold(session, Hold, Book, Stat, hold_id)
+            touch(session, Stat, 'books')
+            return book_id
+
+        book_id = self._write(cancel)
+        invalidate(Book, book_id)
+        self._books_changed([book_id])
+
+    def expire_holds(self, on_date=None):
+        def sweep():
+            changed = holds.expire_holds(self.session, Hold, Book, Stat, on_date)
+            if changed:
+                touch(self.session, Stat, 'books')
+            return changed
+
+        changed = run_atomically(self.session, sweep)
+        for book_id in changed:
+            invalidate(Book, book_id)
+        self._books_changed(changed)
+        return changed
+
+    def accrue_penalties(self, on_date=None):
+        return run_atomically(self.session, lambda: accrue_overdue(self.session, Transaction, Stat, on_date))
+
+    def _transactions_with_details(self):
+        # Book and borrower come back in the same SELECT as the transaction
+        return self.session.query(Transaction).options(
+            joinedload(Transaction.book),
+            joinedload(Transaction.user)
+        )
+
+    def _transaction_with_details(self, transaction_id):
+        # Loan payloads name the book and borrower, so writes hand back the
+        # loan reloaded with both (one query)
+        return self._transactions_with_details().populate_existing().filter(
+            Transaction.id == transaction_id
+        ).one()
 
     def get_overdue_books(self):
         today = datetime.utcnow().date()
-        return self.session.query(Transaction).filter(
-            Transaction.status == "Borrowed",
+        return self._transactions_with_details().filter(
+            Transaction.status.in_(OPEN_STATUSES),
             Transaction.due_date < today
         ).all()
 
-    def search_books(self, query):
+    def import_records(self, kind, stream, fmt, batch_size=None):
+        table = {'books': Book.__table__, 'users': User.__table__}[kind]
+        report = import_records(self.session, table, kind, stream, fmt, self.domain, batch_size)
+        invalidate_all(Book if kind == 'books' else User)
+        autocomplete.index.mark_stale()
+        touch(self.session, Stat, kind)
+        self.session.commit()
+        # Upserts don't say which rows were new, so recount once afterwards
+        stats.reconcile(self.session, Stat, Book, User, Transaction)
+        return report
+
+    def get_book(self, book_id):
+        # Cached read-only snapshot; load through the session to modify
+        return load_record(self.session, Book, book_id)
+
+    def get_user(self, user_id):
+        return load_record(self.session, User, user_id)
+
+    def get_book_by_isbn(self, isbn):
+        # Any ISBN-10/13 form; raises ValueError if it isn't an ISBN
+        return self.session.query(Book).filter(Book.isbn13 == canonical_isbn(isbn)).first()
+
+    def get_books_by_isbn(self, isbns):
+        # One IN query on isbn13 for the whole batch. Returns a match per
+        # requested ISBN, in request order; book is None when nothing matches
+        # or the ISBN isn't valid
+        canonical = canonical_isbns(isbns)
+        wanted = {isbn13 for isbn13 in canonical.values() if isbn13}
+        found = {}
+        if wanted:
+            found = {book.isbn13: book for book in self.session.query(Book).filter(Book.isbn13.in_(wanted))}
+        return [{'isbn': isbn, 'isbn13': canonical[isbn], 'book': found.get(canonical[isbn])}
+                for isbn in isbns]
+
+    def list_books(self, limit=None, after=None):
+        return keyset_page(self.session.query(Book), Book.id, limit, after)
+
+    def list_users(self, limit=None, after=None):
+        return keyset_page(self.session.query(User), User.id, limit, after)
+
+    def search_books(self, query, limit=None):
+        if self.full_text:
+            return search_fts(self.session, Book, 'books_fts', query, limit)
         return self.session.query(Book).filter(
             (Book.title.ilike(f"%{query}%")) |
             (Book.author.ilike(f"%{query}%")) |
             (Book.genre.ilike(f"%{query}%")) |
             (Book.isbn.ilike(f"%{query}%"))
-        ).all()
+        ).limit(limit).all()
 
-    def search_users(self, query):
+    def search_users(self, query, limit=None):
+        if self.full_text:
+            return search_fts(self.session, User, 'users_fts', query, limit)
         return self.session.query(User).filter(
             (User.name.ilike(f"%{query}%")) |
             (User.email.ilike(f"%{query}%")) |
             (User.student_id.ilike(f"%{query}%"))
-        ).all()
+        ).limit(limit).all()
+
+    def _history(self, column, value):
+        # Live and archived loans, newest first; each side is one indexed query
+        live = self._transactions_with_details().filter(
+            getattr(Transaction, column) == value
+        ).order_by(Transaction.borrow_date.desc(), Transaction.id.desc()).all()
+        archived = self.session.query(ArchivedTransaction).options(
+            joinedload(ArchivedTransaction.book),
+            joinedload(ArchivedTransaction.user)
+        ).filter(
+            getattr(ArchivedTransaction, column) == value
+        ).order_by(ArchivedTransaction.borrow_date.desc(), ArchivedTransaction.id.desc()).all()
+        return archive.merged_history(live, archived)
+
+    def rebuild_autocomplete(self):
+        autocomplete.build(autocomplete.index, self.session, Book, User)
+        return len(autocomplete.index)
 
     def get_user_history(self, user_id):
-        return self.session.query(Transaction).filter(
-            Transaction.user_id == user_id
-        ).order_by(Transaction.borrow_date.desc()).all()
+        return self._history('user_id', user_id)
 
     def get_book_history(self, book_id):
-        return self.session.query(Transaction).filter(
-            Transaction.book_id == book_id
-        ).order_by(Transaction.borrow_date.desc()).all()
+        return self._history('book_id', book_id)
+
+    def archive_loans(self, older_than_days=None, batch_size=None, pause=0.0):
+        return archive.archive_returned(self.session, Transaction, ArchivedTransaction, Stat,
+                                        older_than_days, batch_size, pause=pause)
+
+    def get_etag(self, *tables):
+        versions = read_versions(self.session, Stat, tables)
+        if versions is None:
+            return None
+        sync_versions(versions, {'books': Book, 'users': User})
+        return make_etag(versions)
+
+    def get_dashboard_stats(self):
+        return stats.read_stats(self.session, Stat, Book, User, Transaction)
 
     def get_system_info(self):
         return {
@@ -0,0 +1,107 @@
+import base64
+import json
+from datetime import date
+from .config import Config
+from .serializers import dumps
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+def clamp_limit(limit):
+    if limit is None:
+        return Config.DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), Config.MAX_PAGE_SIZE))
+
+
+def keyset_page(query, id_column, limit=None, after=None):
+    # Seeks past the cursor on the primary key instead of using OFFSET, so
+    # every page costs the same no matter how deep the client has scrolled.
+    # Returns the rows and the cursor for the next page (None on the last one)
+    limit = clamp_limit(limit)
+    if after is not None:
+        query = query.filter(id_column > after)
+    rows = query.order_by(id_column).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], id_column.key)
+    return rows, next_cursor
+
+
+def _key_columns(sort_column, id_column):
+    return [sort_column] if sort_column is id_column else [sort_column, id_column]
+
+
+def _seek(columns, values, ascending):
+    # Rows strictly past values in scan order. Spelled so the range on the
+    # leading column can be read off its index
+    if len(columns) == 1:
+        return columns[0] > values[0] if ascending else columns[0] < values[0]
+    (column, id_column), (value, id_value) = columns, values
+    if ascending:
+        return (column >= value) & ((column > value) | (id_column > id_value))
+    return (column <= value) & ((column < value) | (id_column < id_value))
+
+
+def sorted_page(query, sort_column, id_column, limit=None, after=None, before=None, descending=False):
+    # Keyset pagination on any indexed column, with the id breaking ties. A
+    # cursor is the [sort value, id] of the row at the edge of a page; after
+    # pages forward from it and before pages back, each one index range read
+    # however deep it is. Returns the rows and the cursors for the next and
+    # previous pages (None at either end)
+    limit = clamp_limit(limit)
+    columns = _key_columns(sort_column, id_column)
+    backward = before is not None
+    cursor = before if backward else after
+    ascending = descending == backward
+    if cursor is not None:
+        query = query.filter(_seek(columns, cursor, ascending))
+    rows = query.order_by(*(column.asc() if ascending else column.desc() for column in columns)) \
+        .limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+
+    def key(row):
+        return [getattr(row, column.key) for column in columns]
+
+    next_cursor = key(rows[-1]) if (backward or more) else None
+    prev_cursor = key(rows[0]) if (more if backward else cursor is not None) else None
+    return rows, next_cursor, prev_cursor
+
+
+def encode_cursor(values):
+    # URL-safe token for a sorted_page cursor
+    values = [value.isoformat() if isinstance(value, date) else value for value in values]
+    return base64.urlsafe_b64encode(dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort_column, id_column):
+    # The cursor's values, typed for the columns. None for no token;
+    # ValueError for one that can't be read
+    if not token:
+        return None
+    columns = _key_columns(sort_column, id_column)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("wrong length")
+        return [date.fromisoformat(value) if column.type.python_type is date else column.type.python_type(value)
+                for value, column in zip(values, columns)]
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
+
+
+def iter_rows(query, id_column, batch_size=None):
+    # Streams the whole result set, holding at most one batch in memory
+    batch_size = batch_size or Config.STREAM_BATCH_SIZE
+    return query.order_by(id_column).yield_per(batch_size)
+
+
+def ndjson_lines(rows, serialize):
+    for row in rows:
+        yield dumps(serialize(row)) + "\n"
@@ -0,0 +1,75 @@
+import argparse
+import sys
+from datetime import datetime
+from sqlalchemy import case, cast, func, Integer
+from .config import Config
+from . import stats
+from .etags import touch
+
+# Overdue fines computed set-wise in SQL. accrue_overdue flips every loan
+# past its due date to "Overdue" and writes its capped fee in bulk UPDATEs,
+# so listings read penalty_fee as a plain column instead of working it out
+# row by row in Python. Run it daily (see main() and the API's startup job).
+
+
+def penalty_for(due_date, on_date=None):
+    on_date = on_date or datetime.utcnow().date()
+    days_overdue = (on_date - due_date).days
+    if days_overdue <= 0:
+        return 0.00
+    return min(days_overdue * Config.PENALTY_RATE, Config.MAX_PENALTY)
+
+
+def penalty_expression(Transaction, on_date):
+    # SQL twin of penalty_for (SQLite date arithmetic)
+    days_overdue = cast(func.julianday(on_date.isoformat()) - func.julianday(Transaction.due_date), Integer)
+    return case(
+        (days_overdue <= 0, 0.0),
+        (days_overdue * Config.PENALTY_RATE >= Config.MAX_PENALTY, Config.MAX_PENALTY),
+        else_=days_overdue * Config.PENALTY_RATE
+    )
+
+
+def accrue_overdue(session, Transaction, Stat=None, on_date=None):
+    # Returns how many loans became overdue in this run. Does not commit
+    on_date = on_date or datetime.utcnow().date()
+    fee = penalty_expression(Transaction, on_date)
+
+    newly_overdue = session.query(Transaction).filter(
+        Transaction.status == "Borrowed",
+        Transaction.due_date < on_date
+    ).update({Transaction.status: "Overdue", Transaction.penalty_fee: fee},
+             synchronize_session=False)
+
+    # Fees on loans that were already overdue keep growing until the cap
+    refreshed = session.query(Transaction).filter(
+        Transaction.status == "Overdue",
+        Transaction.penalty_fee < Config.MAX_PENALTY
+    ).update({Transaction.penalty_fee: fee}, synchronize_session=False)
+
+    if Stat is not None:
+        stats.bump(session, Stat, active_loans=-newly_overdue, overdue_loans=newly_overdue)
+        if newly_overdue or refreshed:
+            touch(session, Stat, 'transactions')
+    return newly_overdue
+
+
+def main(argv=None):
+    from .models import startup_schema_check
+    from .operations import LibrarySystem
+
+    parser = argparse.ArgumentParser(description="Mark overdue loans and accrue their fines")
+    parser.parse_args(argv)
+
+    startup_schema_check()
+    library = LibrarySystem()
+    try:
+        newly_overdue = library.accrue_penalties()
+    finally:
+        library.close()
+    print(f"{newly_overdue} loans became overdue")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
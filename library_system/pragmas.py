@@ -0,0 +1,89 @@
+import argparse
+import logging
+import sys
+from sqlalchemy import event
+from .config import Config
+
+# Per-connection SQLite tuning from Config.SQLITE_PRAGMAS. Most of these
+# settings only last for the connection that set them, so they are applied
+# from the engine's "connect" event to every connection the pool opens. WAL
+# is what lets readers keep going while a checkout or return commits; the
+# busy timeout makes a second writer wait for the lock instead of failing
+# straight away with "database is locked".
+
+logger = logging.getLogger(__name__)
+
+# Settings that read back as numbers
+_ENUMS = {
+    'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3},
+    'temp_store': {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2},
+}
+
+
+def install_pragmas(engine, pragmas=None):
+    # Returns False for non-SQLite engines, which are left untouched
+    engine = getattr(engine, 'sync_engine', engine)
+    if engine.dialect.name != 'sqlite':
+        return False
+    pragmas = Config.SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+    return True
+
+
+def _normalize(name, value):
+    value = _ENUMS.get(name, {}).get(str(value).upper(), value)
+    return str(value).lower()
+
+
+def check_pragmas(engine, pragmas=None):
+    # {name: (configured, effective, ok)} as read back from a pooled connection.
+    # A mismatch usually means an in-memory database (no WAL) or a build that
+    # caps mmap_size
+    engine = getattr(engine, 'sync_engine', engine)
+    if engine.dialect.name != 'sqlite':
+        return {}
+    pragmas = Config.SQLITE_PRAGMAS if pragmas is None else pragmas
+    with engine.connect() as conn:
+        effective = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in pragmas}
+    return {name: (value, effective[name], _normalize(name, value) == _normalize(name, effective[name]))
+            for name, value in pragmas.items()}
+
+
+def report_pragmas(engine, pragmas=None):
+    # Startup check: logs the effective settings and warns about any that
+    # didn't take
+    report = check_pragmas(engine, pragmas)
+    if report:
+        logger.info("SQLite settings: %s", ", ".join(
+            f"{name}={effective}" for name, (_, effective, _) in report.items()))
+    for name, (configured, effective, ok) in report.items():
+        if not ok:
+            logger.warning("SQLite %s is %s, configured %s", name, effective, configured)
+    return report
+
+
+def main(argv=None):
+    from .models import get_engine
+
+    parser = argparse.ArgumentParser(description="Show the effective SQLite settings of the configured database")
+    parser.parse_args(argv)
+
+    report = check_pragmas(get_engine())
+    if not report:
+        print("Not a SQLite database")
+        return 0
+    for name, (configured, effective, ok) in report.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name} = {effective} (configured {configured})")
+    return 0 if all(ok for _, _, ok in report.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
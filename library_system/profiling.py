@@ -0,0 +1,226 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import Config
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# Opt-in profiling of single requests. With Config.PROFILING on, a request
+# carrying an X-Profile header or a _profile query parameter (whose value
+# must equal Config.PROFILE_TOKEN when one is set) runs under a profiler and
+# is answered with a JSON report instead of its normal body: the hottest
+# functions plus every SQL statement it ran, with timings. With PROFILING off
+# the middleware isn't installed at all.
+#
+# The API runs its queries on the worker thread pool, so each LibraryHandle
+# call is profiled in its worker (see profiled()) and the pieces merged.
+# The event loop part of a profile also sees whatever else the loop was
+# doing at the time; profile on a quiet instance.
+
+HEADER = 'x-profile'
+PARAM = '_profile'
+
+_active = ContextVar('library_profile', default=None)
+_listening = False
+
+
+def _profiler_kind():
+    if Config.PROFILER == 'pyinstrument' or (Config.PROFILER == 'auto' and pyinstrument is not None):
+        if pyinstrument is None:
+            raise RuntimeError("PROFILER = 'pyinstrument' but pyinstrument is not installed")
+        return 'pyinstrument'
+    return 'cprofile'
+
+
+class RequestProfile:
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.kind = _profiler_kind()
+        self.segments = []
+        self.queries = []
+        self.started = time.perf_counter()
+
+    def start(self):
+        # Starts profiling the current thread; returns the stop function
+        if self.kind == 'pyinstrument':
+            profiler = pyinstrument.Profiler(async_mode='disabled')
+            profiler.start()
+            self.segments.append(profiler)
+            return profiler.stop
+        profiler = cProfile.Profile()
+        self.segments.append(profiler)
+        profiler.enable()
+        return profiler.disable
+
+    def run(self, func, *args, **kwargs):
+        stop = self.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stop()
+
+    def _profile_text(self):
+        if self.kind == 'pyinstrument':
+            return "\n".join(profiler.output_text(unicode=False) for profiler in self.segments)
+        output = io.StringIO()
+        stats = pstats.Stats(*self.segments, stream=output)
+        stats.sort_stats('cumulative').print_stats(Config.PROFILE_TOP)
+        return output.getvalue()
+
+    def report(self, status):
+        elapsed = time.perf_counter() - self.started
+        report = {
+            'method': self.method,
+            'path': self.path,
+            'status': status,
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'profiler': self.kind,
+            'query_count': len(self.queries),
+            'query_ms': round(sum(seconds for _, seconds in self.queries) * 1000, 3),
+            'queries': [{'statement': statement, 'ms': round(seconds * 1000, 3)}
+                        for statement, seconds in self.queries],
+            'profile': self._profile_text(),
+            'stored': None,
+        }
+        if Config.PROFILE_DIR:
+            report['stored'] = self._store(report)
+        return report
+
+    def _store(self, report):
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        now = time.time()
+        name = "{}.{:03d}-{}-{}".format(time.strftime('%Y%m%d-%H%M%S', time.localtime(now)),
+                                        int(now * 1000) % 1000, self.method,
+                                        self.path.strip('/').replace('/', '_') or 'root')
+        base = os.path.join(Config.PROFILE_DIR, name)
+        with open(f'{base}.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        if self.kind == 'cprofile':
+            # For snakeviz / pstats
+            pstats.Stats(*self.segments).dump_stats(f'{base}.prof')
+        return f'{base}.json'
+
+
+def profiled(func):
+    # Wraps func so it runs under the current request's profiler, if any.
+    # Called where work is handed to another thread
+    profile = _active.get() if Config.PROFILING else None
+    if profile is None:
+        return func
+    return lambda *args, **kwargs: profile.run(func, *args, **kwargs)
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info['profile_started'] = time.perf_counter()
+
+
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get()
+    if profile is not None and 'profile_started' in conn.info:
+        profile.queries.append((statement, time.perf_counter() - conn.info.pop('profile_started')))
+
+
+def _listen():
+    # Statement capture on every engine, only ever installed with PROFILING on
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _record_statement)
+        event.listen(Engine, 'after_cursor_execute', _finish_statement)
+        _listening = True
+
+
+def requested(header_value, query_string):
+    value = header_value or (parse_qs(query_string).get(PARAM) or [None])[0]
+    if not value:
+        return False
+    return Config.PROFILE_TOKEN is None or value == Config.PROFILE_TOKEN
+
+
+def _json_body(report):
+    return json.dumps(report, indent=2).encode()
+
+
+class WSGIProfiler:
+    # For the Flask app: app.wsgi_app = WSGIProfiler(app.wsgi_app)
+    def __init__(self, app):
+        self.app = app
+        _listen()
+
+    def __call__(self, environ, start_response):
+        if not requested(environ.get('HTTP_X_PROFILE'), environ.get('QUERY_STRING', '')):
+            return self.app(environ, start_response)
+
+        profile = RequestProfile(environ['REQUEST_METHOD'], environ.get('PATH_INFO', '/'))
+        token = _active.set(profile)
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = int(status.split()[0])
+            return lambda data: None
+
+        def run_request():
+            # Draining the body inside the profiler covers streamed responses
+            body = self.app(environ, capture_start_response)
+            try:
+                for _ in body:
+                    pass
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+
+        try:
+            profile.run(run_request)
+        finally:
+            _active.reset(token)
+        body = _json_body(profile.report(captured.get('status')))
+        start_response('200 OK', [('Content-Type', 'application/json'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+
+class ASGIProfiler:
+    # For the API: app.add_middleware(ASGIProfiler)
+    def __init__(self, app):
+        self.app = app
+        _listen()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get('headers') or [])
+        header = headers.get(HEADER.encode())
+        if not requested(header.decode() if header else None, scope.get('query_string', b'').decode()):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope['method'], scope['path'])
+        token = _active.set(profile)
+        captured = {}
+
+        async def capture_send(message):
+            if message['type'] == 'http.response.start':
+                captured['status'] = message['status']
+
+        stop = profile.start()
+        try:
+            await self.app(scope, receive, capture_send)
+        finally:
+            stop()
+            _active.reset(token)
+        body = _json_body(profile.report(captured.get('status')))
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
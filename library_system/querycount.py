@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+
+
+class QueryCounter:
+    # Records every statement sent to the engine while the block is active
+    def __init__(self, engine):
+        # AsyncEngine exposes its events on the wrapped sync engine
+        self.engine = getattr(engine, 'sync_engine', engine)
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+@contextmanager
+def assert_num_queries(engine, expected):
+    # Fails if the wrapped block runs a different number of statements, so an
+    # endpoint that starts lazy-loading per row is caught immediately
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count != expected:
+        executed = "\n".join(counter.statements)
+        raise AssertionError(
+            f"Expected {expected} queries, got {counter.count}:\n{executed}"
+        )
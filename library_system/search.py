@@ -0,0 +1,108 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from .config import Config
+
+# FTS5 index name -> (content table, indexed columns, bm25 column weights)
+FTS_INDEXES = {
+    'books_fts': ('books', ('title', 'author', 'genre', 'isbn'), (10.0, 5.0, 1.0, 2.0)),
+    'users_fts': ('users', ('name', 'email', 'student_id'), (10.0, 5.0, 5.0)),
+}
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Database -> whether its FTS indexes exist. Keyed on the database rather
+# than the URL so the sync and aiosqlite engines share the answer. Filled by
+# install_fts, or by a one-off probe in processes that didn't run it (the
+# indexes were installed by a deploy step or another worker)
+_enabled = {}
+
+
+def _index_ddl(index, table, columns):
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    # External-content index: the text lives only in the base table and the
+    # triggers keep the inverted index in step with every write
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+        f"{cols}, content='{table}', content_rowid='id', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {index}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {index}({index}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {index}({index}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {index}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+def _fts5_supported(conn):
+    try:
+        conn.exec_driver_sql("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+        conn.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        return True
+    except OperationalError:
+        return False
+
+
+def install_fts(engine):
+    # Creates the FTS5 indexes and sync triggers, indexing existing rows the
+    # first time. Returns False (and searches fall back to LIKE scans) when
+    # the engine isn't SQLite or was built without FTS5
+    if not Config.FULL_TEXT_SEARCH or engine.dialect.name != 'sqlite':
+        return False
+
+    with engine.begin() as conn:
+        if not _fts5_supported(conn):
+            return False
+        for index, (table, columns, _) in FTS_INDEXES.items():
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (index,)
+            ).first()
+            for statement in _index_ddl(index, table, columns):
+                conn.exec_driver_sql(statement)
+            if not exists:
+                conn.exec_driver_sql(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+
+    _enabled[engine.url.database] = True
+    return True
+
+
+def fts_enabled(engine):
+    if not Config.FULL_TEXT_SEARCH or engine.dialect.name != 'sqlite':
+        return False
+    database = engine.url.database
+    if database not in _enabled:
+        names = ", ".join(f"'{index}'" for index in FTS_INDEXES)
+        with engine.connect() as conn:
+            found = conn.exec_driver_sql(
+                f"SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN ({names})"
+            ).scalar()
+        _enabled[database] = found == len(FTS_INDEXES)
+    return _enabled[database]
+
+
+def match_expression(query):
+    # Every word in the query must match the start of an indexed token, so
+    # "gats fitz" finds "The Great Gatsby" by F. Scott Fitzgerald
+    terms = _TOKEN.findall(query.lower())
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_fts(session, model, index, query, limit=None):
+    expression = match_expression(query)
+    if not expression:
+        return []
+
+    table, _, weights = FTS_INDEXES[index]
+    rank = f"bm25({index}, {', '.join(str(w) for w in weights)})"
+    sql = (
+        f"SELECT {table}.* FROM {index} JOIN {table} ON {table}.id = {index}.rowid "
+        f"WHERE {index} MATCH :expression ORDER BY {rank}"
+    )
+    params = {'expression': expression}
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params['limit'] = limit
+    return session.query(model).from_statement(text(sql)).params(**params).all()
@@ -0,0 +1,86 @@
+import json
+from operator import attrgetter
+from .config import Config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Row -> dict projections shared by the Flask app and the FastAPI service, so
+# a book, member or loan has the same JSON shape whichever one served it.
+# Each projection is a single attrgetter call over a fixed field list, which
+# works the same on ORM rows and on entity-cache snapshots and never touches
+# an attribute (or relationship) outside that list.
+
+BOOK_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'author': 'author',
+    'genre': 'genre',
+    'isbn': 'isbn',
+    'quantity': 'quantity',
+}
+
+USER_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'email': 'email',
+    'student_id': 'student_id',
+    'membership_type': 'membership_type',
+    'join_date': 'join_date',
+    'books_loaned': 'books_loaned',
+}
+
+# Loans carry the book title and borrower name, so they must be loaded with
+# their book and user (see transactions_with_details)
+TRANSACTION_FIELDS = {
+    'id': 'id',
+    'book_id': 'book_id',
+    'user_id': 'user_id',
+    'book_title': 'book.title',
+    'user_name': 'user.name',
+    'borrow_date': 'borrow_date',
+    'due_date': 'due_date',
+    'return_date': 'return_date',
+    'status': 'status',
+    'penalty_fee': 'penalty_fee',
+}
+
+HOLD_FIELDS = {
+    'id': 'id',
+    'book_id': 'book_id',
+    'user_id': 'user_id',
+    'position': 'position',
+    'status': 'status',
+    'placed_at': 'placed_at',
+    'expires_at': 'expires_at',
+}
+
+
+def projection(fields, dates=()):
+    keys = tuple(fields)
+    getter = attrgetter(*fields.values())
+
+    def project(row):
+        record = dict(zip(keys, getter(row)))
+        for key in dates:
+            value = record[key]
+            if value is not None:
+                # Dates only, even if a datetime was assigned in memory
+                record[key] = value.isoformat()[:10]
+        return record
+    return project
+
+
+book_to_dict = projection(BOOK_FIELDS)
+user_to_dict = projection(USER_FIELDS, dates=('join_date',))
+transaction_to_dict = projection(TRANSACTION_FIELDS, dates=('borrow_date', 'due_date', 'return_date'))
+hold_to_dict = projection(HOLD_FIELDS, dates=('placed_at', 'expires_at'))
+
+
+def dumps(value):
+    # Compact JSON text, through orjson when it is enabled and installed
+    if Config.ORJSON and orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(',', ':'), default=str)
@@ -0,0 +1,92 @@
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+from .config import Config
+from .models import engine_options, dispose_engine, get_session
+from .pragmas import install_pragmas
+from .archive import attach_archive
+from .metrics import instrument_engine
+from .profiling import profiled
+from .operations import LibrarySystem
+from .writer import GroupCommitWriter
+
+_async_engine = None
+_async_sessionmaker = None
+_writer = None
+
+
+def get_async_sessionmaker():
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        try:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        except ImportError as e:
+            raise RuntimeError("ASYNC_ENGINE requires SQLAlchemy's asyncio extension (greenlet) and aiosqlite") from e
+        _async_engine = create_async_engine(
+            Config.ASYNC_DATABASE_URL,
+            **engine_options(Config.ASYNC_DATABASE_URL, is_async=True)
+        )
+        attach_archive(_async_engine)
+        install_pragmas(_async_engine)
+        instrument_engine(_async_engine, 'api_async')
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+def get_writer():
+    # The process's group-commit writer, or None when Config.GROUP_COMMIT is off
+    global _writer
+    if Config.GROUP_COMMIT and _writer is None:
+        _writer = GroupCommitWriter(get_session, name='api')
+    return _writer if Config.GROUP_COMMIT else None
+
+
+class LibraryHandle:
+    # Per-request LibrarySystem whose blocking calls run on the worker thread
+    # pool, keeping the event loop free while the query is in flight. Writes
+    # wait there for their group commit too
+    def __init__(self):
+        self.library = LibrarySystem(writer=get_writer())
+
+    async def run(self, method, *args, **kwargs):
+        return await run_in_threadpool(profiled(method), self.library, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.library.close)
+
+
+class AsyncLibraryHandle:
+    # Same interface over an aiosqlite AsyncSession. LibrarySystem methods run
+    # unchanged inside run_sync, with their I/O awaited on the event loop
+    def __init__(self):
+        self.session = get_async_sessionmaker()()
+
+    async def run(self, method, *args, **kwargs):
+        return await self.session.run_sync(
+            lambda session: method(LibrarySystem(session), *args, **kwargs)
+        )
+
+    async def close(self):
+        await self.session.close()
+
+
+@asynccontextmanager
+async def open_library():
+    handle = AsyncLibraryHandle() if Config.ASYNC_ENGINE else LibraryHandle()
+    try:
+        yield handle
+    finally:
+        await handle.close()
+
+
+async def get_library():
+    # FastAPI dependency: one session, and so one unit of work, per request
+    async with open_library() as handle:
+        yield handle
+
+
+async def dispose_engines():
+    if _writer is not None:
+        await run_in_threadpool(_writer.close)
+    dispose_engine()
+    if _async_engine is not None:
+        await _async_engine.dispose()
@@ -0,0 +1,62 @@
+import time
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from .config import Config
+
+# Dashboard counters kept in a small name/value table. Every write path bumps
+# the affected counters inside its own transaction, so reading the dashboard
+# is a single primary-key scan of a handful of rows. A periodic recount
+# (triggered lazily from read_stats) corrects any drift. Like circulation.py,
+# the model classes are passed in so both frontends can share the code.
+
+COUNTERS = ('books', 'copies', 'users', 'active_loans', 'overdue_loans')
+
+
+def bump(session, Stat, **deltas):
+    for name, delta in deltas.items():
+        if delta:
+            session.query(Stat).filter(Stat.name == name).update(
+                {Stat.value: Stat.value + delta}, synchronize_session=False)
+
+
+def loan_closed(session, Stat, previous_status):
+    # A returned loan leaves whichever open bucket it was counted in
+    if previous_status == "Overdue":
+        bump(session, Stat, copies=1, overdue_loans=-1)
+    else:
+        bump(session, Stat, copies=1, active_loans=-1)
+
+
+def count_all(session, Book, User, Transaction):
+    def loans(status):
+        return session.query(func.count(Transaction.id)).filter(Transaction.status == status).scalar()
+
+    return {
+        'books': session.query(func.count(Book.id)).scalar(),
+        # Copies currently on the shelf
+        'copies': session.query(func.coalesce(func.sum(Book.quantity), 0)).scalar(),
+        'users': session.query(func.count(User.id)).scalar(),
+        'active_loans': loans("Borrowed"),
+        'overdue_loans': loans("Overdue"),
+    }
+
+
+def reconcile(session, Stat, Book, User, Transaction):
+    values = count_all(session, Book, User, Transaction)
+    values['reconciled_at'] = int(time.time())
+    try:
+        for name, value in values.items():
+            session.merge(Stat(name=name, value=value))
+        session.commit()
+    except IntegrityError:
+        # Another worker seeded the table at the same moment; its counts win
+        session.rollback()
+    return values
+
+
+def read_stats(session, Stat, Book, User, Transaction):
+    values = dict(session.query(Stat.name, Stat.value).all())
+    age = time.time() - values.get('reconciled_at', 0)
+    if age > Config.STATS_RECONCILE_INTERVAL or any(name not in values for name in COUNTERS):
+        values = reconcile(session, Stat, Book, User, Transaction)
+    return values
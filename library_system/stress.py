@@ -0,0 +1,110 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from .models import Base, Book, User, Transaction, engine_options
+from .pragmas import install_pragmas
+from .operations import LibrarySystem
+from .datagen import isbn13
+
+# Concurrent checkout/return stress run against a scratch SQLite database.
+# Every worker races for the same few copies; afterwards the shelf count,
+# open loans and per-user counters must still agree exactly.
+#
+#   python -m library_system.stress --threads 32 --copies 5 --rounds 200
+
+
+def run(threads, copies, rounds, path=None, hold=0.0):
+    path = path or os.path.join(tempfile.mkdtemp(), 'stress.db')
+    url = f'sqlite:///{path}'
+    engine = create_engine(url, **engine_options(url))
+    install_pragmas(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    setup = LibrarySystem(Session())
+    book = setup.add_book('Stress Test', 'Nobody', 'Test', isbn13(1), copies)
+    user_ids = [setup.add_user(f'Worker {n}', f'worker{n}@stress.test', None, 'Student').id
+                for n in range(threads)]
+    setup.close()
+
+    stats = {'borrowed': 0, 'rejected': 0, 'returned': 0, 'errors': 0, 'peak_loans': 0}
+    held = [0]
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker(user_id):
+        library = LibrarySystem(Session())
+        start.wait()
+        for _ in range(rounds):
+            try:
+                transaction = library.borrow_book(book.id, user_id)
+                outcome = 'borrowed'
+            except ValueError:
+                transaction, outcome = None, 'rejected'
+            except Exception:
+                transaction, outcome = None, 'errors'
+            with lock:
+                stats[outcome] += 1
+                if transaction is not None:
+                    # Loans committed and not yet being returned; never more
+                    # than there are copies unless a copy was handed out twice
+                    held[0] += 1
+                    stats['peak_loans'] = max(stats['peak_loans'], held[0])
+            if transaction is not None:
+                time.sleep(hold)
+                with lock:
+                    held[0] -= 1
+                library.return_book(transaction.id)
+                with lock:
+                    stats['returned'] += 1
+        library.close()
+
+    workers = [threading.Thread(target=worker, args=(user_id,)) for user_id in user_ids]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    session = Session()
+    shelf = session.get(Book, book.id).quantity
+    open_loans = session.query(func.count(Transaction.id)).filter(Transaction.status != "Returned").scalar()
+    loaned = session.query(func.coalesce(func.sum(User.books_loaned), 0)).scalar()
+    session.close()
+    engine.dispose()
+
+    problems = []
+    if stats['peak_loans'] > copies:
+        problems.append(f"oversold: {stats['peak_loans']} loans open at once for {copies} copies")
+    if shelf < 0:
+        problems.append(f"oversold: shelf count is {shelf}")
+    if shelf + open_loans != copies:
+        problems.append(f"shelf ({shelf}) + open loans ({open_loans}) != {copies} copies")
+    if loaned != open_loans:
+        problems.append(f"user loan counters ({loaned}) != open loans ({open_loans})")
+    return stats, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent borrow/return consistency check")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--copies', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=100)
+    parser.add_argument('--hold', type=float, default=0.0, help="Seconds each loan is kept before its return")
+    args = parser.parse_args(argv)
+
+    stats, problems = run(args.threads, args.copies, args.rounds, hold=args.hold)
+    print(", ".join(f"{key}={value}" for key, value in stats.items()))
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems:
+        print("OK: no oversell, counters consistent")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
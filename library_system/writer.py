@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from .config import Config
+from .circulation import run_atomically
+
+# Group commit. SQLite takes one writer at a time, so when every request
+# commits on its own, a burst of checkouts queues up on the write lock and on
+# one WAL sync per commit, and the slowest time out as "database is locked".
+# With Config.GROUP_COMMIT the write paths instead hand their work to a
+# single writer thread. It takes whatever has queued up (and, while writes
+# are arriving together, waits up to GROUP_COMMIT_WINDOW for more to join),
+# applies it in one transaction and commits once for the whole batch.
+#
+# Each operation runs in its own savepoint, so one that fails (no copy left,
+# a duplicate ISBN) is rolled back alone and its caller gets its own error;
+# the rest of the batch still commits. Work is a callable taking the
+# writer's session and must not commit. Results are ORM objects from a
+# session that is closed after the batch, so callers should only read
+# attributes that are already loaded.
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    def __init__(self, session_factory, window=None, max_batch=None, name='writer'):
+        self.session_factory = session_factory
+        self.window = Config.GROUP_COMMIT_WINDOW if window is None else window
+        self.max_batch = max_batch or Config.GROUP_COMMIT_MAX_BATCH
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.operations = 0
+        self.largest_batch = 0
+        self._last_batch = 0
+
+    def submit(self, work):
+        # Queues work(session) for the next batch; returns a Future
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"group-commit-{self.name}", daemon=True)
+                self._thread.start()
+            self._queue.put((work, future))
+        return future
+
+    def run(self, work):
+        # Blocks until work's batch has committed; raises what work raised
+        return self.submit(work).result()
+
+    def close(self):
+        # Commits what is already queued, then stops the thread
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(_STOP)
+        if thread is not None:
+            thread.join()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'operations': self.operations,
+            'mean_batch': round(self.operations / self.batches, 2) if self.batches else 0,
+            'largest_batch': self.largest_batch,
+            'queued': self._queue.qsize(),
+        }
+
+    def _next_batch(self):
+        # Blocks for the first item, then takes what else is queued. Only
+        # waits out the window for more while writes are arriving together,
+        # so a lone write isn't held back. Returns (batch, stop)
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + (self.window if self._last_batch > 1 else 0)
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        session = self.session_factory()
+
+        def apply():
+            # Retried from the top if SQLite reports busy, so outcomes are
+            # only kept from the attempt that commits
+            connection = session.connection()
+            if connection.dialect.name == 'sqlite':
+                # Take the write lock up front: a deferred transaction that
+                # has read could otherwise fail to upgrade halfway through
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+            outcomes = []
+            for work, _ in batch:
+                try:
+                    with session.begin_nested():
+                        outcomes.append((work(session), None))
+                except Exception as e:
+                    outcomes.append((None, e))
+            return outcomes
+
+        try:
+            outcomes = run_atomically(session, apply)
+        except Exception as e:
+            # The commit itself failed; nothing in the batch was written
+            outcomes = [(None, e)] * len(batch)
+        finally:
+            session.close()
+
+        self.batches += 1
+        self.operations += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self._last_batch = len(batch)
+        for (_, future), (result, error) in zip(batch, outcomes):
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
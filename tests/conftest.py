@@ -0,0 +1,51 @@
+import os
+import sys
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library_system.cache import entity_cache, fragment_cache
+from library_system.migrations import migrate
+from library_system.models import Base, engine_options
+from library_system.pragmas import install_pragmas
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # The caches are per process, and every test has a database of its own
+    entity_cache.clear()
+    fragment_cache.clear()
+    yield
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # A migrated scratch database with the API's schema
+    url = f"sqlite:///{tmp_path / 'library.db'}"
+    engine = create_engine(url, **engine_options(url))
+    install_pragmas(engine)
+    Base.metadata.create_all(engine)
+    migrate(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def Session(engine):
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    # The Flask app (app.py) on a migrated scratch database
+    import app as module
+    module.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'flask.db'}"
+    with module.app.app_context():
+        module.db.create_all()
+        module.migrate(module.db.engine, module.MIGRATIONS)
+    yield module
+    with module.app.app_context():
+        module.db.session.remove()
+        module.db.engine.dispose()
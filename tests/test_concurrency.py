@@ -0,0 +1,57 @@
+import threading
+from sqlalchemy import func
+from library_system import stress
+from library_system.config import Config
+from library_system.datagen import isbn13
+from library_system.models import Book, User, Transaction
+from library_system.operations import LibrarySystem
+
+
+def test_concurrent_checkouts_never_oversell(tmp_path):
+    # Eight workers race for the same two copies, keeping each loan briefly
+    # so that checkouts overlap
+    stats, problems = stress.run(threads=8, copies=2, rounds=25, path=str(tmp_path / 'stress.db'),
+                                 hold=0.002)
+    assert problems == []
+    assert stats['errors'] == 0
+    assert stats['borrowed'] == stats['returned'] > 0
+    assert stats['rejected'] > 0
+
+
+def test_concurrent_checkouts_respect_loan_cap(Session, monkeypatch):
+    # One borrower checking out twelve different books at once: exactly
+    # MAX_BOOKS_PER_USER of the checkouts may succeed
+    monkeypatch.setattr(Config, 'MAX_BOOKS_PER_USER', 3)
+    setup = LibrarySystem(Session())
+    book_ids = [setup.add_book(f'Book {n}', 'Author', 'Test', isbn13(n), 1).id for n in range(1, 13)]
+    user_id = setup.add_user('Borrower', 'borrower@example.test', None, 'Student').id
+    setup.close()
+
+    outcomes = []
+    start = threading.Barrier(len(book_ids))
+
+    def borrow(book_id):
+        library = LibrarySystem(Session())
+        start.wait()
+        try:
+            library.borrow_book(book_id, user_id)
+            outcomes.append('borrowed')
+        except ValueError:
+            outcomes.append('rejected')
+        finally:
+            library.close()
+
+    threads = [threading.Thread(target=borrow, args=(book_id,)) for book_id in book_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    session = Session()
+    open_loans = session.query(func.count(Transaction.id)).filter(Transaction.user_id == user_id).scalar()
+    loaned = session.get(User, user_id).books_loaned
+    shelf = session.query(func.sum(Book.quantity)).scalar()
+    session.close()
+    assert sorted(outcomes) == ['borrowed'] * 3 + ['rejected'] * 9
+    assert open_loans == loaned == 3
+    assert shelf == len(book_ids) - 3
@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+import pytest
+from library_system.datagen import isbn13
+from library_system.models import Book, User, Transaction
+from library_system.operations import LibrarySystem
+from library_system.querycount import assert_num_queries
+
+# Each read path costs a fixed number of statements however many loans it
+# returns. A relationship that starts lazy-loading per row shows up here as
+# a count that grows with the data
+
+
+def seed(session, Book, User, Transaction, loans):
+    # Five books, three borrowers; a third of the loans returned on the day
+    # they were borrowed, and the open ones spread either side of their due date
+    today = date.today()
+    books = [Book(title=f'Book {n}', author=f'Author {n}', genre='Test', isbn=isbn13(n), quantity=5)
+             for n in range(5)]
+    users = [User(name=f'Borrower {n}', email=f'borrower{n}@example.test', membership_type='Student',
+                  join_date=today) for n in range(3)]
+    session.add_all(books + users)
+    session.flush()
+    for n in range(loans):
+        borrowed = today - timedelta(days=n % 40)
+        returned = n % 3 == 0
+        session.add(Transaction(
+            book_id=books[n % len(books)].id,
+            user_id=users[n % len(users)].id,
+            borrow_date=borrowed,
+            due_date=borrowed + timedelta(days=14),
+            return_date=borrowed if returned else None,
+            status="Returned" if returned else "Borrowed"
+        ))
+    session.commit()
+
+
+def touch_relations(rows):
+    # What the serializers read from every loan
+    return [(row.book.title, row.user.name) for row in rows]
+
+
+@pytest.fixture(params=[20, 400], ids=lambda loans: f"{loans}-loans")
+def library(request, Session):
+    session = Session()
+    seed(session, Book, User, Transaction, request.param)
+    session.close()
+    library = LibrarySystem(Session())
+    # Archive some of the returned loans so history reads from both tables
+    library.archive_loans(older_than_days=10)
+    library.session.expunge_all()
+    yield library
+    library.close()
+
+
+def test_user_history(library, engine):
+    # Live loans, then archived ones
+    with assert_num_queries(engine, 2):
+        rows = library.get_user_history(1)
+        touch_relations(rows)
+    assert rows
+
+
+def test_overdue_books(library, engine):
+    with assert_num_queries(engine, 1):
+        rows = library.get_overdue_books()
+        touch_relations(rows)
+    assert rows
+
+
+@pytest.fixture(params=[20, 400], ids=lambda loans: f"{loans}-loans")
+def flask_client(request, flask_app):
+    with flask_app.app.app_context():
+        seed(flask_app.db.session, flask_app.Book, flask_app.User, flask_app.Transaction, request.param)
+    with flask_app.app.test_client() as client:
+        yield client
+
+
+def flask_engine(flask_app):
+    with flask_app.app.app_context():
+        return flask_app.db.engine
+
+
+def test_flask_transaction_list(flask_app, flask_client):
+    # Table versions for the ETag, then the page with book and borrower
+    with assert_num_queries(flask_engine(flask_app), 2):
+        response = flask_client.get('/api/transactions')
+    assert response.status_code == 200
+
+
+def test_flask_transaction_detail(flask_app, flask_client):
+    with assert_num_queries(flask_engine(flask_app), 2):
+        response = flask_client.get('/api/transactions/1')
+    assert response.status_code == 200
+    assert response.get_json()['book_title']
@@ -0,0 +1,40 @@
+from sqlalchemy import create_engine
+from library_system.migrations import migrate, check_query_plans, HOT_QUERIES, FLASK_TABLES
+from library_system.models import Base, Transaction, engine_options
+
+# EXPLAIN QUERY PLAN for every HOT_QUERIES entry: each must be answered from
+# an index, never by scanning the loan table or sorting it in a temp B-tree
+
+
+def assert_indexed(results):
+    assert set(results) == set(HOT_QUERIES)
+    scans = {name: plan for name, (uses_index, plan) in results.items() if not uses_index}
+    assert not scans
+
+
+def test_hot_queries_use_indexes(engine):
+    assert_indexed(check_query_plans(engine))
+
+
+def test_migrations_index_an_old_database(tmp_path):
+    # A database from before the loan indexes: the tables exist, the indexes
+    # don't, so only the migration can provide them
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(url, **engine_options(url))
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for index in Transaction.__table__.indexes:
+            conn.exec_driver_sql(f"DROP INDEX {index.name}")
+    try:
+        results = check_query_plans(engine)
+        assert not any(uses_index for uses_index, _ in results.values())
+        migrate(engine)
+        assert_indexed(check_query_plans(engine))
+    finally:
+        engine.dispose()
+
+
+def test_flask_hot_queries_use_indexes(flask_app):
+    with flask_app.app.app_context():
+        results = check_query_plans(flask_app.db.engine, flask_app.HOT_QUERIES, FLASK_TABLES['transaction'])
+    assert_indexed(results)
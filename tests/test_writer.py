@@ -0,0 +1,90 @@
+import threading
+import pytest
+from library_system.circulation import reserve_copy
+from library_system.datagen import isbn13
+from library_system.models import Book, User, Transaction
+from library_system.operations import LibrarySystem
+from library_system.writer import GroupCommitWriter
+
+
+def test_failed_operation_is_rolled_back_alone(Session):
+    setup = LibrarySystem(Session())
+    gone = setup.add_book('Out', 'Author', 'Test', isbn13(1), 0).id
+    user_id = setup.add_user('Borrower', 'borrower@example.test', None, 'Student').id
+    setup.close()
+
+    writer = GroupCommitWriter(Session)
+    # Hold the first batch open so the next three queue up behind it and
+    # are committed together
+    started, release = threading.Event(), threading.Event()
+
+    def hold_open(session):
+        started.set()
+        return release.wait(5)
+
+    first = writer.submit(hold_open)
+    started.wait(5)
+
+    def add(n):
+        def work(session):
+            session.add(Book(title=f'Book {n}', author='Author', genre='Test', isbn=isbn13(n), quantity=1))
+        return work
+
+    def add_then_borrow(session):
+        # Writes a row, then fails: the row must not survive
+        add(3)(session)
+        session.flush()
+        reserve_copy(session, Book, User, gone, user_id)
+
+    futures = [writer.submit(add(2)), writer.submit(add_then_borrow), writer.submit(add(4))]
+    release.set()
+    assert first.result() is True
+    futures[0].result()
+    futures[2].result()
+    with pytest.raises(ValueError, match="Book not available"):
+        futures[1].result()
+    writer.close()
+
+    assert writer.batches == 2
+    assert writer.largest_batch == 3
+    session = Session()
+    assert sorted(isbn for isbn, in session.query(Book.isbn)) == sorted([isbn13(1), isbn13(2), isbn13(4)])
+    session.close()
+
+
+def test_concurrent_checkouts_through_the_writer(Session):
+    # Eight borrowers race for two copies; each checkout succeeds or fails on
+    # its own even when it shares a batch
+    setup = LibrarySystem(Session())
+    book_id = setup.add_book('Popular', 'Author', 'Test', isbn13(1), 2).id
+    user_ids = [setup.add_user(f'Borrower {n}', f'borrower{n}@example.test', None, 'Student').id
+                for n in range(8)]
+    setup.close()
+
+    writer = GroupCommitWriter(Session, window=0.01)
+    outcomes = []
+    start = threading.Barrier(len(user_ids))
+
+    def borrow(user_id):
+        library = LibrarySystem(Session(), writer=writer)
+        start.wait()
+        try:
+            library.borrow_book(book_id, user_id)
+            outcomes.append('borrowed')
+        except ValueError:
+            outcomes.append('rejected')
+        finally:
+            library.close()
+
+    threads = [threading.Thread(target=borrow, args=(user_id,)) for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    assert sorted(outcomes) == ['borrowed'] * 2 + ['rejected'] * 6
+    session = Session()
+    assert session.query(Transaction).count() == 2
+    assert session.get(Book, book_id).quantity == 0
+    session.close()